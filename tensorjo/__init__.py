@@ -4,6 +4,12 @@ from . import naming
 from . import math
 from . import graph
 from . import node
+from . import backprop
+from . import forward
+from . import batch
+from . import compiler
+from . import codegen
+from . import stream
 
 from tensorjo import ops
 from tensorjo import opt
@@ -12,7 +18,9 @@ tensor = tensor_base.tensor
 
 monoid = node.monoid
 functor = node.functor
+fused = node.fused
 primitive = node.primitive
+mapped = node.mapped
 
 
 ops = ops
@@ -26,7 +34,15 @@ div = math.div
 mul = math.mul
 mse = math.mse
 var = math.var
+placeholder = math.placeholder
+reduce = math.reduce
 gradients = math.gradients
+vjp = math.vjp
+jvp = math.jvp
+vmap = math.vmap
+
+compile = compiler.compile
+generate = codegen.generate
 
 sigmoid = math.sigmoid
 sin = math.sin
@@ -0,0 +1,387 @@
+"""This module implements reverse mode differentiation.
+
+The gradients are calculated in one sweep over the graph.
+
+First all nodes between the requested primitives and the output are
+put in an order where every node comes after all the nodes consuming
+its output. When the sweep reaches a node the gradients of all its
+consumers are therefore already known and the chain rule can be applied
+directly:
+
+derr / dc_node = sum_{i} (derr / dn_i_node) * (dn_i_node / dc_node)
+
+No recursion is used so the depth of the graph is only limited by memory.
+
+Only nodes that lie on a path to the output are visited. Branches that
+never feed the output, e.g other heads sharing an input, are skipped.
+
+The gradients of a plan are cached until a primitive the output depends
+on gets a new version or the structure of the graph changes.
+"""
+import tensorjo
+from . import graph
+from . import node
+import numpy as np
+
+
+def consumer_order(primitives: ["node.node"],
+                   relevant: {"node.node"} = None) -> ["node.node"]:
+    """Order all nodes reachable from the primitives, consumers first.
+
+    This is the post-order of a depth first search along the forward
+    connections. It is done with an explicit stack since the graph
+    can be deeper than the python stack.
+
+    If relevant is given, connections to nodes outside of it are not
+    followed.
+    """
+    order = []
+    visited = set()
+
+    for p in primitives:
+        if p in visited:
+            continue
+
+        visited.add(p)
+        stack = [(p, iter(p.c))]
+        while stack:
+            n, connections = stack[-1]
+
+            for c in connections:
+                if relevant is not None and c.n not in relevant:
+                    continue
+
+                if c.n not in visited:
+                    visited.add(c.n)
+                    stack.append((c.n, iter(c.n.c)))
+                    break
+            else:
+                # All consumers of n are done.
+                stack.pop()
+                order.append(n)
+
+    return order
+
+
+def broadcast_axes(shape: tuple, target: tuple) -> tuple:
+    """Get the axes an array of target shape was broadcast along.
+
+    Summing an array of shape over these axes (keeping dims) and reshaping
+    it gives an array of the target shape.
+    """
+    # Axes the target did not have at all
+    leading = len(shape) - len(target)
+    if leading < 0:
+        return ()
+
+    return tuple(range(leading)) + tuple(
+        leading + i for i, d in enumerate(target)
+        if d == 1 and shape[leading + i] != 1)
+
+
+def reduce_to(gradient: np.ndarray, shape: tuple) -> np.ndarray:
+    """Sum a gradient over the axes its input was broadcast along.
+
+    The result has the shape of the input so that a variable always
+    gets a gradient of its own shape.
+    """
+    axes = broadcast_axes(np.shape(gradient), shape)
+    if not axes:
+        return gradient
+
+    return np.sum(gradient, axis=axes, keepdims=True).reshape(shape)
+
+
+def read_only(a: np.ndarray) -> np.ndarray:
+    """Get a view of a that can not be written to."""
+    view = a.view()
+    view.flags.writeable = False
+
+    return view
+
+
+class edge():
+    """A connection in a plan and the buffers of its contribution.
+
+    The buffers are allocated the first time the edge is used and are
+    reused as long as the shapes stay the same.
+    """
+
+    def __init__(self, consumer: int, gradient_op):
+        """Initialize the edge with the consumer index and gradient op."""
+        self.consumer = consumer
+        self.gradient_op = gradient_op
+
+        self.product = None
+        self.axes = ()
+        self.sum = None
+
+    def accumulate(self, upstream: np.ndarray, gradient: np.ndarray):
+        """Add the contribution of this edge to gradient in place."""
+        local = self.gradient_op()
+
+        shape = np.broadcast(upstream, local).shape
+        if self.product is None or self.product.shape != shape:
+            self.product = np.empty(shape, dtype=gradient.dtype)
+            self.axes = broadcast_axes(shape, gradient.shape)
+
+            self.sum = None
+            if self.axes:
+                self.sum = np.empty(
+                    [1 if i in self.axes else d for i, d in enumerate(shape)],
+                    dtype=gradient.dtype)
+
+        # This might be the most important line of all in this program
+        np.multiply(upstream, local, out=self.product)
+
+        if self.sum is None:
+            np.add(gradient, self.product, out=gradient)
+        else:
+            np.sum(self.product, axis=self.axes, keepdims=True, out=self.sum)
+            np.add(gradient, self.sum.reshape(gradient.shape), out=gradient)
+
+
+class plan():
+    """A compiled backward pass of outputs wrt a list of primitives.
+
+    The plan is built from the connection lists once and holds the order
+    of the sweep, the gradient ops of every node and the gradient buffers.
+    Running it again only does the numpy math, the buffers are zeroed and
+    accumulated in place.
+
+    With several outputs the sweep calculates the vector-Jacobian product,
+    the sum over the outputs of the seed of each output times its gradient.
+    Shared nodes are only swept once.
+
+    The graph owns the plans and throws them away when its structure
+    changes.
+    """
+
+    def __init__(self, outputs: ["node.node"], primitives: ["node.node"]):
+        """Build the plan."""
+        self.outputs = list(outputs)
+        self.primitives = list(primitives)
+
+        # The nodes that lie on a path to an output, inputs first so
+        # the forward pass can be calculated without recursion.
+        self.forward = graph.get_topological_order(self.outputs)
+        relevant = set(self.forward)
+
+        self.nodes = consumer_order(
+            [p for p in self.primitives if p in relevant], relevant)
+
+        # Primitives that do not reach an output get a zero gradient
+        # without any traversal.
+        self.disconnected = []
+        for p in self.primitives:
+            if p not in relevant and p not in self.disconnected:
+                self.disconnected.append(p)
+
+        self.nodes.extend(self.disconnected)
+        index = {n: i for i, n in enumerate(self.nodes)}
+
+        # For every node the consumers it gets gradients from
+        # and the gradient op of that connection.
+        self.edges = [[
+            edge(index[c.n], c.gradient_op) for c in n.c if c.n in relevant
+        ] for n in self.nodes]
+
+        # Gradients keep the shape and dtype of their node
+        self.gradients = [
+            np.zeros(n.shape(), dtype=n.dtype()) for n in self.nodes
+        ]
+
+        # The positions in outputs of the seeds of every seeded node
+        self.seeded = {}
+        for k, o in enumerate(self.outputs):
+            if o in index:
+                self.seeded.setdefault(index[o], []).append(k)
+
+        self.targets = [index[p] for p in self.primitives]
+
+        # The cached gradients are valid as long as no primitive the
+        # outputs depend on has a newer version than this.
+        self.leaves = [n for n in relevant if isinstance(n, node.primitive)]
+        self.version = None
+
+        # The gradients of the primitives in one buffer, see flat.
+        self.flat_gradients = None
+
+    def run(self, seeds: [np.ndarray] = None) -> [np.ndarray]:
+        """Calculate the gradients of the primitives wrt the outputs.
+
+        seeds are the upstream gradients of the outputs, a seed that is
+        None (the default) is ones, as if the output was summed.
+
+        Assumes the graph has been propagated so that all ops hold
+        the state of the latest forward pass.
+
+        The returned arrays are the buffers of the plan, they are
+        overwritten the next time the plan runs.
+        """
+        if seeds is None:
+            seeds = [None] * len(self.outputs)
+
+        gradients = self.gradients
+        for i, edges in enumerate(self.edges):
+            gradient = gradients[i]
+
+            # Nodes depending on placeholders can change shape
+            shape = self.nodes[i].shape()
+            if gradient.shape != shape:
+                gradient = gradients[i] = np.zeros(shape, dtype=gradient.dtype)
+            else:
+                gradient.fill(0)
+
+            # Base case
+            for k in self.seeded.get(i, ()):
+                np.add(gradient, 1 if seeds[k] is None else seeds[k],
+                       out=gradient)
+
+            for e in edges:
+                e.accumulate(gradients[e.consumer], gradient)
+
+        return [gradients[i] for i in self.targets]
+
+    def flat(self) -> np.ndarray:
+        """Get the gradients of the primitives in one flat buffer.
+
+        The gradient buffers of the primitives become views into it, in
+        the order of the primitives. The primitives must be distinct and
+        of one dtype and their shapes must not change.
+        """
+        if self.flat_gradients is None:
+            if len(set(self.targets)) != len(self.targets):
+                raise ValueError("Cannot flatten gradients of repeated "
+                                 "primitives")
+
+            gradients = [self.gradients[i] for i in self.targets]
+
+            dtypes = {g.dtype for g in gradients}
+            if len(dtypes) > 1:
+                raise ValueError("Cannot flatten gradients of dtypes %s" %
+                                 sorted(str(d) for d in dtypes))
+
+            flat = np.empty(sum(g.size for g in gradients),
+                            dtype=dtypes.pop() if dtypes else np.float32)
+
+            start = 0
+            for i, g in zip(self.targets, gradients):
+                view = flat[start:start + g.size].reshape(g.shape)
+                view[...] = g
+
+                self.gradients[i] = view
+                start += g.size
+
+            self.flat_gradients = flat
+
+        return self.flat_gradients
+
+    def evaluate(self, seeds: [np.ndarray] = None) -> [np.ndarray]:
+        """Propagate the graph and run the plan unless cached.
+
+        The forward pass goes once over all nodes the outputs depend
+        on, see graph.propagate. Only runs with the default seeds are
+        cached.
+
+        The gradients are read only views of the buffers of the plan
+        so that the cached gradients can not be changed by the caller.
+        """
+        version = max(p.version for p in self.leaves)
+        if seeds is not None or version != self.version:
+            graph.propagate(self.forward)
+
+            self.run(seeds)
+
+            self.version = None if seeds is not None else version
+
+        return [read_only(self.gradients[i]) for i in self.targets]
+
+
+def symbolic(outputs: ["node.node"],
+             primitives: ["node.node"]) -> ["node.node"]:
+    """Build the gradients of the primitives wrt the outputs as nodes.
+
+    This is the same sweep as a plan does but instead of calculating
+    the contributions it adds nodes calculating them to the graph.
+    Primitives that do not reach an output get a zero tensor.
+    """
+    tensorjo.tjgraph.check_outputs(outputs)
+
+    relevant = set()
+    for o in outputs:
+        relevant.update(graph.get_ancestors(o))
+
+    gradients = {}
+    for n in consumer_order([p for p in primitives if p in relevant],
+                            relevant):
+        # Base case
+        gradient = None
+        for o in outputs:
+            if o is n:
+                seed = graph.apply_functor(n, tensorjo.ops.ones)
+                gradient = seed if gradient is None else gradient + seed
+
+        # New nodes are connected while sweeping so iterate a copy.
+        for c in list(n.c):
+            if c.n not in relevant or gradients[c.n] is None:
+                continue
+
+            contribution = gradients[c.n] * symbolic_local(c)
+            if contribution.shape() != n.shape():
+                contribution = tensorjo.math.reduce(contribution, n.shape())
+
+            if gradient is None:
+                gradient = contribution
+            else:
+                gradient = gradient + contribution
+
+        gradients[n] = gradient
+
+    symbols = []
+    for p in primitives:
+        if gradients.get(p) is None:
+            symbols.append(
+                tensorjo.tensor(np.zeros(p.shape()), dtype=p.dtype()))
+        else:
+            symbols.append(gradients[p])
+
+    return symbols
+
+
+def symbolic_local(c: "node.connection") -> "node.node":
+    """Get the node calculating the gradient op of a connection."""
+    op = c.n.op
+
+    if isinstance(c.n, node.fused):
+        return op.symbolic_input(c.n, c.gradient_op.args[0])
+
+    if c.gradient_op == op.backward_first:
+        return op.symbolic_first(c.n)
+
+    if c.gradient_op == op.backward_second:
+        return op.symbolic_second(c.n)
+
+    return op.symbolic_functor(c.n)
+
+
+def get_plan(outputs: ["node.node"], primitives: ["node.node"]) -> plan:
+    """Get the plan from the graph, building it if there is none."""
+    key = (tuple(outputs), tuple(primitives))
+
+    plans = tensorjo.tjgraph.plans
+    if key not in plans:
+        tensorjo.tjgraph.check_outputs(outputs)
+        plans[key] = plan(outputs, primitives)
+
+    return plans[key]
+
+
+def backward(output: "node.node",
+             primitives: ["node.node"]) -> [np.ndarray]:
+    """Calculate the gradients of the primitives wrt the output.
+
+    Assumes the graph has been propagated so that all ops hold
+    the state of the latest forward pass.
+    """
+    return get_plan([output], primitives).run()
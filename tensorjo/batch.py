@@ -0,0 +1,146 @@
+"""This module implements vectorised evaluation over a batch.
+
+Instead of updating some primitives and evaluating the graph once per
+setting, all settings are stacked along a leading axis and the graph is
+evaluated once. The ops broadcast over the batch axis so every node gets
+the outputs of all settings in one numpy call per op.
+
+As in batched forward mode every value is padded with unit axes up to
+the largest number of dimensions in the graph, with the batch axis in
+front. Values that do not depend on the batched primitives have a batch
+axis of size one and are broadcast.
+
+The gradients are calculated with the same sweep as a backprop plan,
+except that contributions are never summed over the batch axis so every
+setting gets its own gradient.
+"""
+from . import backprop
+from . import forward
+from . import graph
+from . import node
+import numpy as np
+
+
+def vmap(outputs: ["node.node"],
+         over: ["node.node"],
+         values: [np.ndarray],
+         primitives: ["node.node"] = None) -> ([np.ndarray], [np.ndarray]):
+    """Evaluate the outputs for every entry of the stacked values.
+
+    values[i] has a leading axis with one value of over[i] per entry.
+    Returns the outputs and the gradients of the sum of the outputs
+    wrt the primitives, over by default, stacked along the same axis.
+    """
+    if len(over) != len(values):
+        raise ValueError("Got %s values for %s primitives" %
+                         (len(values), len(over)))
+
+    if not over:
+        raise ValueError("Vectorising needs at least one primitive")
+
+    if primitives is None:
+        primitives = over
+
+    order = graph.get_topological_order(outputs)
+    shapes = {n: n.shape() for n in order}
+
+    # Number of dimensions every value is padded to
+    dims = max(len(s) for s in shapes.values())
+
+    entries = None
+    value = {}
+    for p, v in zip(over, values):
+        if not isinstance(p, node.primitive):
+            raise ValueError("Can only vectorise over primitives, got %s" %
+                             p.name)
+
+        v = np.asarray(v, dtype=p.dtype())
+        if v.shape[1:] != p.shape():
+            raise ValueError("Values of shape %s do not match %s" %
+                             (v.shape[1:], p.shape()))
+
+        if entries is None:
+            entries = v.shape[0]
+
+        if v.shape[0] != entries:
+            raise ValueError("Got %s entries expected %s" %
+                             (v.shape[0], entries))
+
+        value[p] = v.reshape(forward.pad(entries, p.shape(), dims))
+
+    for n in order:
+        if n in value:
+            continue
+
+        if isinstance(n, node.primitive):
+            value[n] = n.output().reshape(forward.pad(1, shapes[n], dims))
+            continue
+
+        value[n] = n.op.forward_batched(
+            *[value[m] for m in graph.get_inputs(n)])
+
+    gradients = _backward(outputs, primitives, value)
+
+    results = [
+        np.broadcast_to(value[o], forward.pad(entries, shapes[o], dims))
+        .reshape((entries, ) + shapes[o]) for o in outputs
+    ]
+
+    stacked = []
+    for p in primitives:
+        shape = p.shape()
+        if p not in gradients:
+            stacked.append(np.zeros((entries, ) + shape, dtype=p.dtype()))
+            continue
+
+        g = np.broadcast_to(gradients[p], forward.pad(entries, shape, dims))
+        stacked.append(g.reshape((entries, ) + shape))
+
+    _restore(order)
+
+    return results, stacked
+
+
+def _restore(order: ["node.node"]):
+    """Calculate the plain forward pass so the ops hold its state again.
+
+    Cached outputs and backprop plans read the state of the ops.
+    """
+    value = {}
+    for n in order:
+        if isinstance(n, node.primitive):
+            value[n] = n.output()
+        else:
+            value[n] = n.op.forward(*[value[m] for m in graph.get_inputs(n)])
+
+
+def _backward(outputs: ["node.node"], primitives: ["node.node"],
+              value: {"node.node": np.ndarray}) -> {"node.node": np.ndarray}:
+    """Sweep the batched gradients back to the primitives."""
+    relevant = set()
+    for o in outputs:
+        relevant.update(graph.get_ancestors(o))
+
+    gradients = {}
+    for n in backprop.consumer_order(
+            [p for p in primitives if p in relevant], relevant):
+        # Base case
+        gradient = 0
+        for o in outputs:
+            if o is n:
+                gradient = gradient + np.ones_like(value[n])
+
+        for c in n.c:
+            if c.n not in relevant:
+                continue
+
+            contribution = gradients[c.n] * c.gradient_op()
+
+            # Sum along broadcast axes but never along the batch axis
+            gradient = gradient + backprop.reduce_to(
+                contribution,
+                (np.shape(contribution)[0], ) + value[n].shape[1:])
+
+        gradients[n] = gradient
+
+    return gradients
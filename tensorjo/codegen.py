@@ -0,0 +1,188 @@
+"""This module generates python source code from a graph.
+
+The generated function is straight-line numpy code with one local
+variable per node, there are no node objects or op dispatch left when
+it runs. With a list of variables the function also calculates the
+gradients of the outputs wrt the variables, the backward pass is
+generated in the same function after the forward pass.
+
+The source is a complete module that only depends on numpy, it can be
+inspected through the source attribute or written to disk.
+
+Like a compiled program the generated function reads the current values
+of the primitives every time it is called but does not see changes to
+the structure of the graph. The graph caches the generated functions
+and throws them away when its structure changes.
+"""
+import tensorjo
+import inspect
+from . import backprop
+from . import graph
+from . import node
+
+header = '''"""Generated by tensorjo."""
+import numpy as np
+
+
+'''
+
+
+class generated():
+    """A graph generated into a python function."""
+
+    def __init__(self, outputs: ["node.node"],
+                 variables: ["node.node"] = None):
+        """Generate and compile the source of the outputs."""
+        self.outputs = list(outputs)
+        self.variables = None if variables is None else list(variables)
+
+        nodes = graph.get_topological_order(self.outputs)
+        self.primitives = [n for n in nodes if isinstance(n, node.primitive)]
+
+        names = {n: "n%d" % i for i, n in enumerate(nodes)}
+
+        lines = ["def program(v):"]
+        lines.append('    """Run the graph, v are the values of:')
+        lines.append("")
+        for i, p in enumerate(self.primitives):
+            lines.append("    %d: %s" % (i, _escape(p.name)))
+        lines.append('    """')
+
+        for i, p in enumerate(self.primitives):
+            lines.append("    %s = v[%d]" % (names[p], i))
+
+        for n in nodes:
+            if isinstance(n, node.primitive):
+                continue
+
+            inputs = [names[m] for m in graph.get_inputs(n)]
+            lines.append("    %s = %s" % (names[n], n.op.source(*inputs)))
+
+        results = "[%s]" % ", ".join(names[o] for o in self.outputs)
+        if self.variables is None:
+            lines.append("    return %s" % results)
+        else:
+            gradients = _backward(self.outputs, self.variables, names, lines)
+            lines.append("    return %s, [%s]" % (results,
+                                                  ", ".join(gradients)))
+
+        self.source = header + inspect.getsource(backprop.broadcast_axes) + \
+            "\n\n" + inspect.getsource(backprop.reduce_to) + "\n\n" + \
+            "\n".join(lines) + "\n"
+
+        namespace = {}
+        exec(compile(self.source, "<tensorjo>", "exec"), namespace)
+        self.function = namespace["program"]
+
+    def __call__(self):
+        """Run the generated function.
+
+        Returns the output, or the list of outputs, and if variables
+        were given also the list of gradients.
+        """
+        if self.variables is None:
+            outputs = self.run()
+        else:
+            outputs, gradients = self.run()
+
+        if len(outputs) == 1:
+            outputs = outputs[0]
+
+        if self.variables is None:
+            return outputs
+
+        return outputs, gradients
+
+    def run(self):
+        """Run the generated function and return what it returns."""
+        return self.function([p.v for p in self.primitives])
+
+    def write(self, path: str):
+        """Write the source to path."""
+        with open(path, "w") as f:
+            f.write(self.source)
+
+
+def _escape(name: str) -> str:
+    """Make a node name safe to put in a docstring."""
+    return repr(name)[1:-1].replace('"', '\\"')
+
+
+def _backward(outputs: ["node.node"], variables: ["node.node"],
+              names: {"node.node": str}, lines: [str]) -> [str]:
+    """Add the lines of the backward pass, return the gradient names.
+
+    This is the same sweep as a backprop plan does.
+    """
+    tensorjo.tjgraph.check_outputs(outputs)
+
+    relevant = set()
+    for o in outputs:
+        relevant.update(graph.get_ancestors(o))
+
+    gradients = {}
+    for n in backprop.consumer_order(
+            [p for p in variables if p in relevant], relevant):
+        # Base case
+        terms = [
+            "np.ones(np.shape(%s), dtype=np.%s)" % (names[n], n.dtype().name)
+            for o in outputs if o is n
+        ]
+
+        for c in n.c:
+            if c.n not in relevant:
+                continue
+
+            terms.append("reduce_to(%s * (%s), np.shape(%s))" % (
+                gradients[c.n], _local(c, names), names[n]))
+
+        gradients[n] = "g" + names[n][1:]
+        lines.append("    %s = %s" % (gradients[n], " + ".join(terms)))
+
+    # Variables that do not reach an output get zeros
+    symbols = []
+    for k, p in enumerate(variables):
+        if p not in gradients:
+            gradients[p] = "z%d" % k
+            lines.append("    %s = np.zeros(%r, dtype=np.%s)" %
+                         (gradients[p], p.shape(), p.dtype().name))
+
+        symbols.append(gradients[p])
+
+    return symbols
+
+
+def _local(c: "node.connection", names: {"node.node": str}) -> str:
+    """Get the source of the gradient op of a connection."""
+    n = c.n
+    op = n.op
+
+    if isinstance(n, node.fused):
+        return op.source_input(c.gradient_op.args[0],
+                               [names[m] for m in n.inputs], names[n])
+
+    if c.gradient_op == op.backward_first:
+        return op.source_first(names[n.m1], names[n.m2], names[n])
+
+    if c.gradient_op == op.backward_second:
+        return op.source_second(names[n.m1], names[n.m2], names[n])
+
+    return op.source_functor(names[n.m1], names[n])
+
+
+def generate(outputs, variables: ["node.node"] = None) -> generated:
+    """Generate a function of a node, or a list of nodes.
+
+    With variables the function also returns the gradients wrt them.
+    The function is cached on the graph.
+    """
+    if isinstance(outputs, node.node):
+        outputs = [outputs]
+
+    key = (tuple(outputs), None if variables is None else tuple(variables))
+
+    programs = tensorjo.tjgraph.programs
+    if key not in programs:
+        programs[key] = generated(outputs, variables)
+
+    return programs[key]
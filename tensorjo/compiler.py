@@ -0,0 +1,193 @@
+"""This module compiles a graph into a flat program.
+
+Calling output on a node recurses through all nodes it depends on,
+for small tensors the interpreter overhead of that dominates the
+numpy work. A program instead holds a precomputed topological list
+of op invocations that reads and writes a list of slots, one slot
+per node.
+
+The program reads the current values of the primitives every time it
+is called. It does not see changes to the structure of the graph, if
+nodes are added or removed it has to be compiled again.
+
+A program can also plan its memory. Intermediates of elementwise ops
+are written into a pool of buffers that are allocated once, a buffer is
+reused as soon as the value in it has been consumed by all nodes. The
+outputs, the nodes the user asks to keep and the values the backward
+pass reads are never reused.
+
+Only programs plan their memory. Calling output on the nodes and the
+backward passes of the backprop module allocate their arrays as before.
+"""
+import functools
+from . import graph
+from . import node
+import numpy as np
+
+
+class program():
+    """A graph compiled into a flat list of op invocations."""
+
+    def __init__(self,
+                 outputs: ["node.node"],
+                 reuse: bool = False,
+                 keep: ["node.node"] = None):
+        """Compile the program of the outputs.
+
+        If reuse, the memory of the intermediates is planned. The nodes
+        in keep can be fetched after the program has run.
+        """
+        self.outputs = list(outputs)
+        self.keep = [] if keep is None else list(keep)
+        self.reuse = reuse
+
+        self.nodes = graph.get_topological_order(self.outputs + self.keep)
+        index = {n: i for i, n in enumerate(self.nodes)}
+
+        self.slots = [None] * len(self.nodes)
+
+        # Primitives are copied into their slots when the program starts
+        self.primitives = []
+
+        # (forward, first slot, second slot, output slot)
+        # second slot is None for functors. For fused nodes first slot
+        # is None and second slot are the slots of all inputs.
+        self.instructions = []
+
+        for i, n in enumerate(self.nodes):
+            if isinstance(n, node.primitive):
+                self.primitives.append((i, n))
+            elif isinstance(n, node.monoid):
+                self.instructions.append(
+                    (n.op.forward, index[n.m1], index[n.m2], i))
+            elif isinstance(n, node.functor):
+                self.instructions.append((n.op.forward, index[n.m1], None, i))
+            elif isinstance(n, node.fused):
+                self.instructions.append(
+                    (n.op.forward, None, [index[m] for m in n.inputs], i))
+            else:
+                raise ValueError("Unknown node type %s" % type(n))
+
+        self.targets = [index[o] for o in self.outputs]
+        self.index = index
+
+        # Bytes of the planned buffers and the total bytes of the values
+        # they hold, what the intermediates take if each has its own
+        # array. Without planning the slots keep all of them alive, so
+        # that is also the peak.
+        self.planned_bytes = 0
+        self.intermediate_bytes = 0
+        self.buffers = []
+
+        if reuse:
+            self.plan_memory()
+
+    def plan_memory(self):
+        """Assign the intermediates to reusable buffers.
+
+        The instructions of the planned nodes are replaced by ones
+        writing into their buffer. The buffers have the shapes of the
+        latest forward pass, if placeholders are fed other shapes the
+        program has to be compiled again.
+        """
+        alive = {self.index[n] for n in self.outputs + self.keep}
+
+        last_use = {}
+        for n in self.nodes:
+            inputs = graph.get_inputs(n)
+            if not inputs:
+                continue
+
+            saved = n.op.saved_inputs
+            for k, m in enumerate(inputs):
+                last_use[self.index[m]] = self.index[n]
+
+                # The backward pass of n reads m
+                if saved is None or k in saved:
+                    alive.add(self.index[m])
+
+            if n.op.saved_output:
+                alive.add(self.index[n])
+
+        # The buffer of every planned slot and the free buffers by
+        # shape and dtype
+        assigned = {}
+        free = {}
+
+        for j, (forward, m1, m2, i) in enumerate(self.instructions):
+            n = self.nodes[i]
+            if i not in alive and n.op.elementwise:
+                key = (n.shape(), np.dtype(n.dtype()))
+                if free.get(key):
+                    b = free[key].pop()
+                else:
+                    b = np.empty(*key)
+                    self.buffers.append(b)
+                    self.planned_bytes += b.nbytes
+
+                self.intermediate_bytes += b.nbytes
+                assigned[i] = (key, b)
+                self.instructions[j] = (functools.partial(
+                    n.op.forward_out, out=b), m1, m2, i)
+
+            # The buffers of the values n is the last consumer of can be
+            # reused by the nodes after n. It is only done after n has
+            # run so that n never writes into its own inputs.
+            for s in {self.index[m] for m in graph.get_inputs(n)}:
+                if s in assigned and last_use[s] == i:
+                    key, b = assigned[s]
+                    free.setdefault(key, []).append(b)
+
+    def run(self) -> [np.ndarray]:
+        """Run the program and return the outputs."""
+        slots = self.slots
+
+        for i, p in self.primitives:
+            slots[i] = p.v
+
+        for forward, m1, m2, i in self.instructions:
+            if m2 is None:
+                slots[i] = forward(slots[m1])
+            elif m1 is None:
+                slots[i] = forward(*[slots[j] for j in m2])
+            else:
+                slots[i] = forward(slots[m1], slots[m2])
+
+        return [slots[i] for i in self.targets]
+
+    def fetch(self, n: "node.node") -> np.ndarray:
+        """Get the value of a node from the latest run.
+
+        With planned memory only the outputs and the nodes to keep
+        can be fetched.
+        """
+        if n not in self.index:
+            raise ValueError("%s is not part of the program" % n.name)
+
+        i = self.index[n]
+        if self.reuse and n not in self.outputs + self.keep:
+            raise ValueError("%s is not kept by the program" % n.name)
+
+        return self.slots[i]
+
+    def __call__(self) -> np.ndarray:
+        """Run the program, same as calling output on the outputs."""
+        outputs = self.run()
+
+        if len(outputs) == 1:
+            return outputs[0]
+
+        return outputs
+
+
+def compile(outputs, reuse: bool = False,
+            keep: ["node.node"] = None) -> program:
+    """Compile a node, or a list of nodes, into a program.
+
+    If reuse, the intermediates are written into reusable buffers, see
+    the program.
+    """
+    if isinstance(outputs, node.node):
+        outputs = [outputs]
+
+    return program(outputs, reuse=reuse, keep=keep)
@@ -0,0 +1,106 @@
+"""This module implements forward mode differentiation.
+
+Tangents of the primitives are pushed through the graph alongside the
+forward pass. Each op calculates the tangent of its output from the
+tangents of its inputs, so the directional derivative of all outputs
+comes out of a single pass over the graph.
+
+This is the right complexity when there are few primitives and large
+outputs, reverse mode (the backprop module) is the right one when there
+are many primitives and small outputs.
+
+In batched mode every tangent has a leading axis of directions. To make
+the ops broadcast correctly the tangents are padded with unit axes up to
+the largest number of dimensions in the graph.
+"""
+from . import graph
+from . import node
+import numpy as np
+
+
+def jvp(outputs: ["node.node"],
+        primitives: ["node.node"],
+        tangents: [np.ndarray],
+        batched: bool = False) -> ([np.ndarray], [np.ndarray]):
+    """Calculate the outputs and their tangents given primitive tangents.
+
+    If batched, each tangent has a leading axis with one direction per
+    entry and so do the returned tangents.
+    """
+    if len(primitives) != len(tangents):
+        raise ValueError("Got %s tangents for %s primitives" %
+                         (len(tangents), len(primitives)))
+
+    if batched and not primitives:
+        raise ValueError("Batched tangents need at least one primitive")
+
+    order = graph.get_topological_order(outputs)
+
+    # Number of dimensions every tangent is padded to
+    dims = max(len(n.shape()) for n in order)
+
+    directions = None
+    tangent = {}
+    for p, t in zip(primitives, tangents):
+        t = np.asarray(t, dtype=p.dtype())
+
+        shape = t.shape[1:] if batched else t.shape
+        if shape != p.shape():
+            raise ValueError("Tangent of shape %s does not match %s" %
+                             (shape, p.shape()))
+
+        if batched:
+            if directions is None:
+                directions = t.shape[0]
+
+            if t.shape[0] != directions:
+                raise ValueError("Got %s directions expected %s" %
+                                 (t.shape[0], directions))
+
+            t = t.reshape(pad(t.shape[0], p.shape(), dims))
+
+        tangent[p] = t
+
+    value = {}
+    for n in order:
+        if isinstance(n, node.primitive):
+            value[n] = n.output()
+            continue
+
+        inputs = graph.get_inputs(n)
+        value[n] = n.op.forward(*[value[m] for m in inputs])
+
+        # Nodes that do not depend on the primitives have no tangent
+        ts = [tangent.get(m) for m in inputs]
+        if all(t is None for t in ts):
+            continue
+
+        t = n.op.tangent(
+            *[np.zeros((), dtype=m.dtype()) if t is None else t
+              for m, t in zip(inputs, ts)])
+
+        # Reductions drop the padding, put it back
+        if batched and t.ndim != dims + 1:
+            t = t.reshape(pad(directions, n.shape(), dims))
+
+        tangent[n] = t
+
+    values, output_tangents = [], []
+    for o in outputs:
+        values.append(value[o])
+
+        t = tangent.get(o, np.zeros((), dtype=o.dtype()))
+        if batched:
+            t = np.broadcast_to(t, pad(directions, o.shape(), dims))
+            t = t.reshape((directions, ) + o.shape())
+        elif t.shape != o.shape():
+            t = np.broadcast_to(t, o.shape())
+
+        output_tangents.append(t)
+
+    return values, output_tangents
+
+
+def pad(directions: int, shape: tuple, dims: int) -> tuple:
+    """Get the padded shape of a batch of tangents."""
+    return (directions, ) + (1, ) * (dims - len(shape)) + tuple(shape)
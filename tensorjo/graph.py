@@ -6,8 +6,10 @@ for fetching variables and controlling the cache.
 The graph is also responsible for adding stuff.
 """
 import tensorjo
+import functools
 from . import op as operator
 from . import node
+from . import packing
 import numpy as np
 import logging
 
@@ -27,6 +29,33 @@ class graph():
         # going to be requested often for gradient calculations
         self.variables = {}
 
+        # The dtype of new tensors, set to np.float64 to opt in
+        # to double precision.
+        self.dtype = np.float32
+
+        # Compiled backward passes, see the backprop module, and generated
+        # functions, see the codegen module.
+        # They are only valid as long as the structure is unchanged.
+        self.plans = {}
+        self.programs = {}
+
+        # The node of every expression when common subexpressions are
+        # eliminated, None when they are not. See cse.
+        self.expressions = None
+
+        # Whether ops on constants are folded when added. See fold.
+        self.folding = False
+
+        # Whether outputs are cached, also for nodes added later.
+        # See cache.
+        self.cached = False
+
+        # How values of primitives are checked. See set_validation.
+        self.validation = "first-use"
+
+        # The variables packed in one buffer, None until pack is called.
+        self.packing = None
+
     def get_variables(self, names: [str] = None):
         """Return the variables in the names list."""
         if names is None:
@@ -42,6 +71,28 @@ class graph():
 
         return vars
 
+    def check_outputs(self, outputs: ["node.node"]):
+        """Raise if an output was removed from the graph.
+
+        The connections of a removed node are gone so a backward pass
+        from it would silently give zero gradients.
+        """
+        for o in outputs:
+            if isinstance(o, node.primitive):
+                continue
+
+            if self.nodes.get(o.name) is not o:
+                raise ValueError("%s was removed from the graph %s" %
+                                 (o.name, self.name))
+
+    def check_inputs(self, inputs: ["node.node"]):
+        """Raise if an input was removed from the graph.
+
+        A node applied to a removed node would not be connected to the
+        graph so its gradients would silently be dropped.
+        """
+        self.check_outputs(inputs)
+
     def get_nodes(self, names: [str] = None):
         """Return the nodes in the names list."""
         if names is None:
@@ -66,6 +117,11 @@ class graph():
             n.name = nn
 
         self.nodes[n.name] = n
+        self.plans = {}
+        self.programs = {}
+
+        if self.cached and not isinstance(n, node.primitive):
+            n.output = n._output_cache
 
         if variable:
             self.variables[n.name] = n
@@ -74,30 +130,311 @@ class graph():
         """Clear the entire graph."""
         self.nodes = {}
         self.variables = {}
+        self.plans = {}
+        self.programs = {}
+        self.packing = None
+
+        if self.expressions is not None:
+            self.expressions = {}
 
     def cache(self):
         """Make computations cached in graph.
 
-        This requires a bit of precomputation and is therefore
-        not on by default.
+        A node only calculates its output again when one of its inputs
+        has a new version, see the node.
 
-        If the user adds ops after calling cache then cache needs
-        to be called again.
+        Caching stays on for nodes that are added later until no_cache
+        is called.
         """
+        self.cached = True
+
         for n in self.nodes.values():
-            if isinstance(n, node.primitive):
-                n.calculation_dependencies = get_calculation_dependencies(n)
-                n.update = n._cache_update
-            else:
+            if not isinstance(n, node.primitive):
                 n.output = n._output_cache
 
     def no_cache(self):
         """Make computations uncached."""
+        self.cached = False
+
         for n in self.nodes.values():
+            if not isinstance(n, node.primitive):
+                n.output = n._output_no_cache
+
+    def pack(self) -> packing.packing:
+        """Pack the values of all variables into one contiguous buffer.
+
+        Every variable is left with a view into the buffer. Variables
+        added later are not packed until pack is called again.
+        """
+        self.packing = packing.packing(self.variables.values())
+        return self.packing
+
+    def set_validation(self, policy: str):
+        """Set how the values of primitives are checked for NaN.
+
+        strict checks every value, also updates and feeds. first-use
+        only checks the value a tensor is created with and off never
+        checks. Primitives with a policy of their own keep it.
+        """
+        node.check_validation(policy)
+        self.validation = policy
+
+    def cse(self):
+        """Eliminate common subexpressions when building the graph.
+
+        Applying an op to the same input nodes as an existing node
+        returns the existing node instead of adding a new one. Nodes
+        that are given a name are always added.
+
+        Duplicates already in the graph are not merged, see optimize.
+        """
+        self.expressions = {}
+        for n in get_topological_order(list(self.nodes.values())):
+            if not isinstance(n, node.primitive):
+                self.expressions.setdefault(get_expression(n), n)
+
+    def no_cse(self):
+        """Add a new node every time an op is applied."""
+        self.expressions = None
+
+    def optimize(self) -> int:
+        """Merge the nodes that calculate the same expression.
+
+        Consumers of a duplicate are connected to the first node of
+        the expression instead and the duplicate is removed from the
+        graph. Removed nodes can still be evaluated but they are no
+        longer part of the graph, gradients of them can not be
+        calculated and no ops can be applied to them.
+
+        Returns the number of removed nodes.
+        """
+        self.plans = {}
+        self.programs = {}
+
+        # The table is rebuilt once at the end instead of on every replace
+        table, self.expressions = self.expressions, None
+
+        expressions = {}
+        removed = 0
+
+        # Inputs come first so the inputs of every node have already
+        # been merged when it is reached.
+        for n in get_topological_order(list(self.nodes.values())):
+            if isinstance(n, node.primitive):
+                continue
+
+            e = expressions.setdefault(get_expression(n), n)
+            if e is n:
+                continue
+
+            self.replace(n, e)
+            removed += 1
+
+        if table is not None:
+            self.expressions = expressions
+
+        return removed
+
+    def is_constant(self, n: "node.node") -> bool:
+        """Check if n is a primitive that is not a variable or fed."""
+        return isinstance(n, node.primitive) and \
+            not isinstance(n, node.placeholder) and \
+            self.variables.get(n.name) is not n
+
+    def fold(self) -> int:
+        """Fold the nodes that only depend on constants.
+
+        Every node whose output does not depend on a variable is
+        calculated once and replaced by a primitive holding its output.
+        After calling fold ops applied to constants are folded as they
+        are added, call no_fold to stop that.
+
+        Updating a constant after it has been folded has no effect on
+        the graph.
+
+        Returns the number of folded nodes.
+        """
+        self.folding = True
+
+        self.plans = {}
+        self.programs = {}
+
+        folded = 0
+
+        # Inputs come first so the inputs of every node have already
+        # been folded when it is reached.
+        for n in get_topological_order(list(self.nodes.values())):
             if isinstance(n, node.primitive):
-                n.update = n._no_cache_update
+                continue
+
+            if all(self.is_constant(m) for m in get_inputs(n)):
+                self.replace(n, constant(n.output(), n.name))
+                folded += 1
+
+        if self.expressions is not None:
+            self.cse()
+
+        return folded
+
+    def no_fold(self):
+        """Stop folding ops on constants as they are added."""
+        self.folding = False
+
+    def fuse(self) -> int:
+        """Fuse chains of elementwise nodes into single nodes.
+
+        A node is fused with an input that is an elementwise node with
+        no other consumers, e.g sigmoid(a * x + b) becomes one node
+        with the inputs a, x and b. The fused node calculates the chain
+        in its output array and keeps no intermediates.
+
+        The last node of the chain is turned into the fused node. The
+        other nodes of the chain can still be evaluated but they are no
+        longer part of the graph, gradients of them can not be
+        calculated and no ops can be applied to them.
+
+        Returns the number of removed nodes.
+        """
+        self.plans = {}
+        self.programs = {}
+
+        removed = 0
+        fused = set()
+
+        # Consumers come first so every chain starts at its last node.
+        order = get_topological_order(list(self.nodes.values()))
+        for n in reversed(order):
+            if n in fused or not is_elementwise(n):
+                continue
+
+            # Follow the inputs as long as they can be fused.
+            chain = [n]
+            while True:
+                inputs = [
+                    m for m in get_inputs(chain[-1])
+                    if is_elementwise(m) and len(m.c) == 1
+                ]
+                if not inputs:
+                    break
+
+                chain.append(inputs[0])
+
+            if len(chain) == 1:
+                continue
+
+            chain.reverse()
+            fused.update(chain)
+
+            inputs = []
+            for m in chain:
+                for i in get_inputs(m):
+                    if i not in chain and i not in inputs:
+                        inputs.append(i)
+
+            index = {i: k for k, i in enumerate(inputs)}
+            for j, m in enumerate(chain):
+                index[m] = len(inputs) + j
+
+            op = tensorjo.ops.fused(
+                [(m.op, tuple(index[i] for i in get_inputs(m)))
+                 for m in chain], len(inputs))
+
+            # The rest of the chain only feeds the chain
+            for m in chain:
+                for i in get_inputs(m):
+                    i.c = [c for c in i.c if c.n is not m]
+
+            for m in chain[:-1]:
+                m.c = []
+                del self.nodes[m.name]
+
+            # The last node becomes the fused node so that its consumers
+            # and references to it stay valid.
+            node.fused.convert(n, inputs, op)
+            for k, i in enumerate(inputs):
+                i.c.append(
+                    node.connection(n, functools.partial(op.backward, k)))
+
+            removed += len(chain) - 1
+
+        if self.expressions is not None:
+            self.cse()
+
+        return removed
+
+    def unfuse(self, n: "node.fused"):
+        """Turn a fused node back into the chain of nodes it fused.
+
+        The fused node becomes the last node of the chain so that its
+        consumers and references to it stay valid.
+        """
+        self.plans = {}
+        self.programs = {}
+
+        for i in n.inputs:
+            i.c = [c for c in i.c if c.n is not n]
+
+        nodes = list(n.inputs)
+        for j, (step, args) in enumerate(n.op.steps):
+            inputs = [nodes[i] for i in args]
+
+            if j == len(n.op.steps) - 1:
+                m = n
+                if len(inputs) == 1:
+                    node.functor.convert(n, inputs[0], step)
+                else:
+                    node.monoid.convert(n, inputs[0], inputs[1], step)
+            elif len(inputs) == 1:
+                m = node.functor(inputs[0], step)
+                self.add(m)
             else:
-                n.output = n._output_no_cache
+                m = node.monoid(inputs[0], inputs[1], step)
+                self.add(m)
+
+            if len(inputs) == 1:
+                inputs[0].c.append(node.connection(m, step.backward_functor))
+            else:
+                inputs[0].c.append(node.connection(m, step.backward_first))
+                inputs[1].c.append(node.connection(m, step.backward_second))
+
+            nodes.append(m)
+
+        if self.expressions is not None:
+            self.cse()
+
+    def replace(self, n: "node.node", m: "node.node"):
+        """Connect the consumers of n to m and remove n from the graph.
+
+        n can still be evaluated but it is no longer part of the graph,
+        gradients of it can not be calculated and no ops can be applied
+        to it.
+        """
+        self.plans = {}
+        self.programs = {}
+
+        for c in n.c:
+            if isinstance(c.n, node.fused):
+                c.n.inputs[c.gradient_op.args[0]] = m
+            elif isinstance(c.n, node.functor):
+                c.n.m1 = m
+            elif c.gradient_op == c.n.op.backward_first:
+                c.n.m1 = m
+            else:
+                c.n.m2 = m
+
+            c.n.invalidate()
+            m.c.append(c)
+
+        for i in get_inputs(n):
+            i.c = [c for c in i.c if c.n is not n]
+
+        n.c = []
+        if self.nodes.get(n.name) is n:
+            del self.nodes[n.name]
+
+        # The consumers are now other expressions.
+        if self.expressions is not None:
+            self.cse()
 
     def remove(self, n: 'node.node'):
         """Remove a node from the graph.
@@ -110,6 +447,15 @@ class graph():
         This logic is only used inside of this function so it did not warrant
         it being split up in my humble opinion.
         """
+        self.plans = {}
+        self.programs = {}
+
+        # Fused consumers are unfused so that only the part of the
+        # chain consuming this node is removed.
+        for c in list(n.c):
+            if isinstance(c.n, node.fused):
+                self.unfuse(c.n)
+
         for c in n.c:
             if isinstance(c.n, node.functor):
                 """Recursivley remove these paths."""
@@ -142,7 +488,20 @@ class graph():
                 #    truncate the graph by connecting the other node of the
                 #    monoid To all the things the monoid was connected to
                 for cc in c.n.c:
-                    if isinstance(cc.n, node.functor):
+                    cc.n.invalidate()
+
+                    if isinstance(cc.n, node.fused):
+                        k = cc.gradient_op.args[0]
+
+                        # Connect for forward prop
+                        cc.n.inputs[k] = other_node
+
+                        # Connect for differentiation
+                        other_node.c.append(
+                            node.connection(
+                                cc.n, functools.partial(cc.n.op.backward, k)))
+
+                    elif isinstance(cc.n, node.functor):
                         # Connect for forward prop
                         cc.n.m1 = other_node
 
@@ -184,41 +543,125 @@ class graph():
                                  "Please create an issue showing the graph " +
                                  "and the node you tried removing.")
 
-            # Final step:
-            #    Remove this node from the graph.
+        # Final step:
+        #    Remove this node from the graph.
+        if self.nodes.get(n.name) is n:
             del self.nodes[n.name]
 
-            # If is a variable remove it.
-            if n.name in self.variables:
-                del self.variables[n.name]
+        # If is a variable remove it.
+        if self.variables.get(n.name) is n:
+            del self.variables[n.name]
+
+            if self.packing is not None and n in self.packing.variables:
+                self.packing = None
+
+        # Removing rewires the inputs of nodes.
+        if self.expressions is not None:
+            self.cse()
 
 
 """Define some graph utilities."""
 
 
-def get_calculation_dependencies(node: "node.node") -> ["node.node"]:
-    """Get the calculation dependencies of a node.
+def get_inputs(n: "node.node") -> ["node.node"]:
+    """Get the nodes whose output n consumes."""
+    if isinstance(n, node.monoid):
+        return [n.m1, n.m2]
+
+    if isinstance(n, node.functor):
+        return [n.m1]
+
+    if isinstance(n, node.fused):
+        return n.inputs
+
+    return []
+
+
+def constant(v: np.ndarray, name: str = None) -> "node.primitive":
+    """Make a primitive holding the output of a folded node."""
+    if name is None:
+        name = tensorjo.naming.get_tensor_name()
+
+    return node.primitive(np.asarray(v), name)
+
+
+def is_elementwise(n: "node.node") -> bool:
+    """Check if n is a monoid or functor of an elementwise op."""
+    return isinstance(n, (node.monoid, node.functor)) and n.op.elementwise
+
+
+def get_expression(n: "node.node") -> tuple:
+    """Get what n calculates, its op and the identities of its inputs."""
+    return (n.op.key(), ) + tuple(get_inputs(n))
+
+
+def get_ancestors(n: "node.node") -> {"node.node"}:
+    """Get n and all nodes whose output n depends on."""
+    mem = {n}
+    stack = [n]
+    while stack:
+        for m in get_inputs(stack.pop()):
+            if m not in mem:
+                mem.add(m)
+                stack.append(m)
+
+    return mem
 
-    All nodes whos output depends on the output of this node.
 
-    There can be circles so need to be ware of them.
+def get_topological_order(outputs: ["node.node"]) -> ["node.node"]:
+    """Order the outputs and all nodes they depend on, inputs first.
+
+    This is the post-order of a depth first search along the inputs.
+    It is done with an explicit stack since the graph can be deeper
+    than the python stack.
     """
-    mem = set()
+    order = []
+    visited = set()
+
+    for o in outputs:
+        if o in visited:
+            continue
+
+        visited.add(o)
+        stack = [(o, iter(get_inputs(o)))]
+        while stack:
+            n, inputs = stack[-1]
+
+            for m in inputs:
+                if m not in visited:
+                    visited.add(m)
+                    stack.append((m, iter(get_inputs(m))))
+                    break
+            else:
+                # All inputs of n are done.
+                stack.pop()
+                order.append(n)
 
-    def dfs(n: "node.node"):
-        """DFS the graph to find all connected nodes."""
-        if n in mem:
-            return
+    return order
 
-        mem.add(n)
 
-        # c is all the connections for a node.
-        # n is the node the connection connects to
-        for c in n.c:
-            dfs(c.n)
+def propagate(order: ["node.node"]) -> {"node.node": np.ndarray}:
+    """Calculate the outputs of the nodes in order, inputs first.
+
+    Every node is calculated from the outputs of its inputs instead of
+    calling output on it, which recurses, so the depth of the graph is
+    only limited by memory. Cached nodes are asked for their output,
+    their inputs are already checked so they do not recurse.
 
-    dfs(node)
-    return list(mem)
+    Returns the output of every node.
+    """
+    value = {}
+    for n in order:
+        if isinstance(n, node.primitive) or \
+                n.output.__name__ == "_output_cache":
+            value[n] = n.output()
+            continue
+
+        inputs = get_inputs(n)
+        value[n] = n.op.forward(*[value[m] for m in inputs])
+        n.version = max([n.version] + [m.version for m in inputs])
+
+    return value
 
 
 def apply_monoid(m1: "node.node",
@@ -229,17 +672,32 @@ def apply_monoid(m1: "node.node",
 
     This op is responsible for making the correct connections
     """
-    m1_c = np.ones(m1.shape(), dtype=np.float32)
-    m2_c = np.ones(m2.shape(), dtype=np.float32)
+    tensorjo.tjgraph.check_inputs([m1, m2])
+
+    m1_c = np.ones(m1.shape(), dtype=m1.dtype())
+    m2_c = np.ones(m2.shape(), dtype=m2.dtype())
 
     init_op = op(m1_c, m2_c)
 
+    g = tensorjo.tjgraph
+    if g.folding and g.is_constant(m1) and g.is_constant(m2):
+        return constant(init_op.forward(m1.output(), m2.output()), name)
+
+    expressions = tensorjo.tjgraph.expressions
+    if expressions is not None:
+        key = (init_op.key(), m1, m2)
+        if name is None and key in expressions:
+            return expressions[key]
+
     m = node.monoid(m1, m2, init_op, name=name)
     m1.c.append(node.connection(m, init_op.backward_first))
     m2.c.append(node.connection(m, init_op.backward_second))
     """Add node to graph."""
     tensorjo.tjgraph.add(m)
 
+    if expressions is not None:
+        expressions.setdefault(key, m)
+
     return m
 
 
@@ -249,13 +707,28 @@ def apply_functor(m1: "node.node", op: operator.Op,
 
     This op is responsible for making the correct connections
     """
-    m1_c = np.ones(m1.shape(), dtype=np.float32)
+    tensorjo.tjgraph.check_inputs([m1])
+
+    m1_c = np.ones(m1.shape(), dtype=m1.dtype())
 
     init_op = op(m1_c)
 
+    g = tensorjo.tjgraph
+    if g.folding and g.is_constant(m1):
+        return constant(init_op.forward(m1.output()), name)
+
+    expressions = tensorjo.tjgraph.expressions
+    if expressions is not None:
+        key = (init_op.key(), m1)
+        if name is None and key in expressions:
+            return expressions[key]
+
     m = node.functor(m1, init_op, name=name)
     m1.c.append(node.connection(m, init_op.backward_functor))
     """Add node to graph."""
     tensorjo.tjgraph.add(m)
 
+    if expressions is not None:
+        expressions.setdefault(key, m)
+
     return m
@@ -3,6 +3,9 @@ import tensorjo
 from tensorjo import ops
 from . import node
 from . import graph
+from . import backprop
+from . import forward
+from . import batch
 import numpy as np
 
 
@@ -77,26 +80,129 @@ def cos(m, name: str = None) -> "node.node":
     return graph.apply_functor(m, ops.cos, name=name)
 
 
-def var(obj, name: str = None) -> "node.node":
+def reduce(m, shape: tuple, name: str = None) -> "node.node":
+    """Add reduction op to graph.
+
+    Sums m over the axes it was broadcast along to get shape.
+    """
+    m = ensure_node(m)
+    return graph.apply_functor(
+        m, lambda x: ops.reduction(x, shape), name=name)
+
+
+def var(obj,
+        name: str = None,
+        dtype: np.dtype = None,
+        validation: str = None) -> "node.node":
     """Create a variable."""
-    node = tensorjo.tensor(obj, name=name)
+    node = tensorjo.tensor(obj, name=name, dtype=dtype, validation=validation)
     """Add node to graph."""
     tensorjo.tjgraph.add(node, variable=True)
 
     return node
 
 
-def gradients(node: "node.node", primitives: ["node.node"]) -> [np.ndarray]:
-    """Get gradients of the primitives with respect to the node."""
-    # Propagate the graph once (To update the state)
-    node.output()
+def placeholder(shape: tuple = None,
+                dtype: np.dtype = None,
+                name: str = None) -> "node.node":
+    """Create a placeholder.
+
+    The value is fed when the graph is evaluated, dimensions of the
+    shape that are None can be different with every feed.
+    """
+    if dtype is None:
+        dtype = tensorjo.tjgraph.dtype
+
+    if name is None:
+        name = tensorjo.naming.get_node_name("placeholder")
+
+    p = node.placeholder(shape, dtype, name)
+    """Add node to graph."""
+    tensorjo.tjgraph.add(p)
+
+    return p
+
+
+def gradients(node: "node.node",
+              primitives: ["node.node"],
+              symbolic: bool = False,
+              feed: dict = None) -> [np.ndarray]:
+    """Get gradients of the primitives with respect to the node.
+
+    The gradients are cached until a primitive the node depends on is
+    updated. They are read only views of buffers that are reused, so
+    they change when the gradients of the same node and primitives are
+    recalculated. Copy them to keep them.
+
+    If symbolic, the gradients are returned as new nodes in the graph
+    instead. They can be differentiated again, e.g for Hessian-vector
+    products.
+
+    feed maps placeholders to the values to evaluate the node with.
+    """
+    if feed:
+        tensorjo.node.apply_feed(feed)
+
+    if symbolic:
+        return backprop.symbolic([node], primitives)
 
     # If a gradient of a node is not connected to the 'node'
     # then the gradient will be 0
     # TODO: decide wheter that should throw error or not
+    return backprop.get_plan([node], primitives).evaluate()
+
+
+def vjp(outputs: ["node.node"],
+        primitives: ["node.node"],
+        seeds: [np.ndarray] = None) -> [np.ndarray]:
+    """Get the vector-Jacobian product of the outputs wrt the primitives.
+
+    This is the gradient of sum_{i} seeds[i] * outputs[i], calculated in a
+    single backward pass. A seed that is None is ones and seeds that are
+    None altogether makes this the gradient of the sum of the outputs.
+
+    As with gradients the products are read only views of reused buffers.
+    """
+    if seeds is not None and len(seeds) != len(outputs):
+        raise ValueError("Got %s seeds for %s outputs" %
+                         (len(seeds), len(outputs)))
+
+    return backprop.get_plan(outputs, primitives).evaluate(seeds)
+
+
+def jvp(outputs: ["node.node"],
+        primitives: ["node.node"],
+        tangents: [np.ndarray],
+        batched: bool = False) -> ([np.ndarray], [np.ndarray]):
+    """Get the outputs and their Jacobian-vector products.
+
+    The tangents are the directions of the primitives, the returned
+    tangents are the directional derivatives of the outputs. Everything
+    is calculated in a single forward pass.
+
+    If batched, each tangent has a leading axis of directions and all
+    directions are calculated at once.
+    """
+    return forward.jvp(outputs, primitives, tangents, batched=batched)
+
+
+def vmap(outputs,
+         over: ["node.node"],
+         values: [np.ndarray],
+         primitives: ["node.node"] = None):
+    """Evaluate a node, or a list of nodes, for a batch of values at once.
+
+    values[i] are the values of over[i] stacked along a leading axis.
+    Returns the stacked outputs and the per entry gradients of the
+    outputs wrt the primitives, over by default. If a node was given
+    the output is not put in a list.
+    """
+    single = isinstance(outputs, node.node)
+    if single:
+        outputs = [outputs]
 
-    gradients = []
-    for n in primitives:
-        gradients.append(n.gradient_wrt(node))
+    values, gradients = batch.vmap(outputs, over, values, primitives)
+    if single:
+        values = values[0]
 
-    return gradients
+    return values, gradients
@@ -5,32 +5,86 @@ import logging
 from abc import abstractmethod
 from . import op as operator
 from . import math
+from . import backprop
 
 LOGGER = logging.Logger(__name__)
 
 
+class stamps():
+    """A clock for versions, every tick is later than all before it."""
+
+    def __init__(self):
+        """Initialize the clock."""
+        self.now = 0
+
+    def tick(self) -> int:
+        """Advance the clock and return the new time."""
+        self.now += 1
+        return self.now
+
+
+# Versions are stamped from one clock so that they are comparable
+# across nodes, a larger stamp is a newer value. The clock also ticks
+# when the structure of the graph changes.
+clock = stamps()
+
+# How the values of primitives are checked for NaN:
+# strict checks every value, first-use only the value a tensor is
+# created with and off never checks.
+validations = ("strict", "first-use", "off")
+
+# Number of elements checked for NaN at a time
+chunk_elements = 1 << 20
+
+
+def check_validation(policy: str):
+    """Raise if policy is not a validation policy."""
+    if policy not in validations:
+        raise ValueError("Unknown validation %s, expected one of %s" %
+                         (policy, validations))
+
+
+def has_nan(v: np.ndarray) -> bool:
+    """Check v for NaN without a temporary of the size of v."""
+    if v.ndim == 0 or v.size <= chunk_elements:
+        return bool(np.isnan(v).any())
+
+    step = max(1, chunk_elements // v[:1].size)
+    return any(
+        np.isnan(v[start:start + step]).any()
+        for start in range(0, v.shape[0], step))
+
+
 class node():
     """All nodes are monoids or primitives under tensors and ops."""
 
     def __init__(self, name: str):
-        """Store results of gradient calculations.
+        """Initialize the node.
 
-        When calculating the gradient for one tensor the gradient for
-        all tensors which that tensor affect will also be calculated.
+        Gradient calculations are cached by the backprop plans, keyed by
+        the output and the versions of the primitives it depends on.
 
-        To avoid doing many dubble calculations we store the gradient
-        calculations throughout the backprops so that only gradients have to
-        be calculated once per backprop.
+        The version of a node is the latest version of the primitives
+        its output was calculated from, or the time its inputs were
+        changed if that is later. A cached output is valid as long as
+        the latest version of the inputs is the one seen when it was
+        calculated. This is checked lazily and only when the clock has
+        ticked since the last check.
         """
         self.name = name
-        self.gradient = None
-        self.gradient_cached = False
         self.output_cached = False
         self.output_cache = None
 
+        self.version = 0
+        self.seen = 0
+        self.checked = 0
+
     @abstractmethod
-    def output(self) -> np.ndarray:
-        """Propagate value through node."""
+    def output(self, feed: dict = None) -> np.ndarray:
+        """Propagate value through node.
+
+        feed maps placeholders to the values to evaluate the node with.
+        """
         pass
 
     @abstractmethod
@@ -38,6 +92,36 @@ class node():
         """Return the shape of the output of the node."""
         pass
 
+    @abstractmethod
+    def dtype(self) -> np.dtype:
+        """Return the dtype of the output of the node."""
+        pass
+
+    def invalidate(self):
+        """Make the cached output stale, e.g when the inputs changed."""
+        self.output_cached = False
+        self.version = clock.tick()
+
+    @classmethod
+    def convert(cls, n: "node", *args):
+        """Turn n into a node of this class made from args.
+
+        The name, connections and caching of n are kept so that its
+        consumers and references to it stay valid, e.g when the last
+        node of a chain becomes the fused node.
+        """
+        name, c = n.name, n.c
+        cached = n.output.__name__ == "_output_cache"
+
+        n.__dict__.clear()
+        n.__class__ = cls
+        n.__init__(*args, name=name)
+        n.c = c
+        n.invalidate()
+
+        if cached:
+            n.output = n._output_cache
+
     def gradient_wrt(self, n: "node") -> np.ndarray:
         """Calculate the gradient wrt n.
 
@@ -58,24 +142,10 @@ class node():
         The gradient with respect to the current nodes output is:
         'The sum of the contributions to the next nodes times the next nodes
         contribution to the error'
-        """
-        # Base case
-        if self == n:
-            return np.array(1, dtype=np.float32)
-
-        if self.gradient_cached:
-            return self.gradient
-
-        self.gradient = np.zeros(self.shape())
-        for con in self.c:
-            con_wrt_n = con.n.gradient_wrt(n)
-            self_wrt_con = con.gradient_op()
 
-            # This might be the most important line of all in this program
-            self.gradient = self.gradient + (con_wrt_n * self_wrt_con)
-
-        self.gradient_cached = True
-        return self.gradient
+        The sum is calculated by a sweep in the backprop module.
+        """
+        return backprop.backward(n, [self])[0]
 
     def __add__(self, other):
         """Add add op to graph."""
@@ -140,36 +210,65 @@ class connection():
 
 
 class primitive(node):
-    """Primitive node acts as entry to graph."""
+    """Primitive node acts as entry to graph.
+
+    The validation policy of the primitive is the one of the graph
+    unless it is set, see set_validation.
+
+    The array of a packed primitive is a view into the buffer of the
+    variables of the graph, see graph.pack. Updates are written into it.
 
-    def __init__(self, v: np.ndarray, name):
+    In place updates only write into arrays the primitive owns, an array
+    it was given as it is, e.g a fed value, is copied before the first
+    one.
+    """
+
+    packed = False
+
+    def __init__(self,
+                 v: np.ndarray,
+                 name,
+                 validation: str = None,
+                 owned: bool = False):
         """Primitive node consists of only a tensor."""
         super().__init__(name)
         self.v: np.ndarray = v
         self.c: [connection] = []
-        """Initially nodes are not cached unless a user calls cache on the graph.
 
-        So that things can become pre-computed.
-        (e.g calculation paths and so on)
-        """
-        self.update = self._no_cache_update
-        """The all nodes depending on this node.
+        # Whether v can be written in place
+        self.owned = owned
 
-        All nodes in the calculation dependencies needs to have their cache
-        emptied if this node is altered.
+        if validation is not None:
+            check_validation(validation)
 
-        The calculation path will be updated by the graph object whenever
-        a user calls to initialize the cache. The graph object will also
-        overload the output function of this object with its "_output_cache"
+        self.validation = validation
 
-        The graph object is also responsible for reverting the cache if the
-        user asks for it.
-        """
-        self.calculation_dependencies = []
+        # Bumped every time the value changes
+        self.version = clock.tick()
+
+    def set_validation(self, policy: str = None):
+        """Set how new values are checked, None uses the graph policy."""
+        if policy is not None:
+            check_validation(policy)
+
+        self.validation = policy
 
-    def output(self) -> np.ndarray:
+    def policy(self) -> str:
+        """Return the validation policy in effect."""
+        if self.validation is None:
+            return tensorjo.tjgraph.validation
+
+        return self.validation
+
+    def check(self, v: np.ndarray):
+        """Raise if v contains NaN."""
+        if has_nan(v):
+            raise ValueError("Invalid tensor -- Contains NaN or None.")
+
+    def output(self, feed: dict = None) -> np.ndarray:
         """Return the np.ndarray."""
-        self.gradient_cached = False
+        if feed:
+            apply_feed(feed)
 
         return self.v
 
@@ -177,40 +276,169 @@ class primitive(node):
         """Return shape of primitive np.ndarray."""
         return self.v.shape
 
-    def _no_cache_update(self, v) -> node:
-        """Update the underlying array."""
-        v = np.array(v, dtype=np.float32)
+    def dtype(self) -> np.dtype:
+        """Return dtype of primitive np.ndarray."""
+        return self.v.dtype
+
+    def update(self, v) -> node:
+        """Update the underlying array.
+
+        The primitive gets a new array holding a copy of the value so
+        arrays returned by output before are not changed, use assign_add
+        or assign_sub to write in place. Only a packed primitive writes
+        the value into its view so that it stays packed. The new version
+        makes cached outputs depending on it stale.
+        """
+        if self.packed:
+            v = np.asarray(v, dtype=self.v.dtype)
+        else:
+            v = np.array(v, dtype=self.v.dtype)
 
         if self.v.shape != v.shape:
             raise ValueError("Cannot update tensor of shape %s with shape %s" %
                              (self.v.shape, v.shape))
 
-        self.v = v
+        if self.policy() == "strict":
+            self.check(v)
+
+        if self.packed:
+            self.v[...] = v
+        else:
+            self.v = v
+            self.owned = True
+
+        self.version = clock.tick()
 
         return self
 
-    def _cache_update(self, v) -> node:
-        """Update the underlying array."""
-        v = np.array(v, dtype=np.float32)
+    def assign_add(self, delta) -> node:
+        """Add delta to the underlying array in place."""
+        return self._assign(np.add, delta)
+
+    def assign_sub(self, delta) -> node:
+        """Subtract delta from the underlying array in place."""
+        return self._assign(np.subtract, delta)
+
+    def _assign(self, ufunc, delta) -> node:
+        """Apply ufunc to the array and delta, writing into the array.
+
+        Nothing is allocated when delta is an array of the dtype and the
+        primitive owns its array. The new version makes cached outputs
+        depending on it stale.
+        """
+        if not self.owned:
+            self.v = np.array(self.v)
+            self.owned = True
+
+        if not self.v.flags.writeable:
+            raise ValueError("Cannot update read only tensor %s" % self.name)
+
+        if np.broadcast(self.v, delta).shape != self.v.shape:
+            raise ValueError("Cannot update tensor of shape %s with shape %s" %
+                             (self.v.shape, np.shape(delta)))
+
+        if self.policy() == "strict":
+            self.check(np.asarray(delta))
+
+        ufunc(self.v, delta, out=self.v)
+        self.version = clock.tick()
+
+        return self
+
+    def __str__(self):
+        """Return string rep of underlying array."""
+        return str(self.v)
+
+
+class mapped(primitive):
+    """Primitive node wrapping an array it does not own, e.g a np.memmap.
+
+    The array is never copied, ops read it directly and updates, also
+    in place ones, are written into it. For arrays larger than memory
+    chunks of it can be fed to placeholders instead of evaluating the
+    whole array at once.
+    """
+
+    def update(self, v) -> node:
+        """Write v into the wrapped array."""
+        if not self.v.flags.writeable:
+            raise ValueError("Cannot update read only tensor %s" % self.name)
+
+        v = np.asarray(v, dtype=self.v.dtype)
 
         if self.v.shape != v.shape:
             raise ValueError("Cannot update tensor of shape %s with shape %s" %
                              (self.v.shape, v.shape))
 
+        if self.policy() == "strict":
+            self.check(v)
+
+        self.v[...] = v
+        self.version = clock.tick()
+
+        return self
+
+    def chunks(self, size: int):
+        """Iterate views of at most size entries along the first axis."""
+        if size < 1:
+            raise ValueError("Cannot split tensor in chunks of %s" % size)
+
+        if not self.v.shape:
+            yield self.v
+            return
+
+        for start in range(0, self.v.shape[0], size):
+            yield self.v[start:start + size]
+
+
+class placeholder(primitive):
+    """Primitive node whose value is fed when the graph is evaluated.
+
+    Dimensions of the shape that are None can be different with every
+    feed, e.g the size of a batch. If the shape is None any shape can be
+    fed. Until something is fed the value is zeros with a size of one
+    along the free dimensions.
+    """
+
+    def __init__(self, shape: tuple, dtype: np.dtype, name: str):
+        """Placeholder consists of the shape and dtype it can be fed."""
+        self.spec = None if shape is None else tuple(shape)
+
+        zeros = () if shape is None else [1 if d is None else d for d in shape]
+        super().__init__(np.zeros(zeros, dtype=dtype), name, owned=True)
+
+    def feed(self, v) -> node:
+        """Set the value the graph is evaluated with."""
+        v = np.asarray(v, dtype=self.v.dtype)
+
+        if self.spec is not None and (
+                len(self.spec) != v.ndim or
+                any(d is not None and d != s
+                    for d, s in zip(self.spec, v.shape))):
+            raise ValueError("Cannot feed placeholder of shape %s with %s" %
+                             (self.spec, v.shape))
+
+        if self.policy() == "strict":
+            self.check(v)
+
         self.v = v
-        """Empty all caches."""
-        for node in self.calculation_dependencies:
-            node.output_cached = False
+        self.owned = False
+        self.version = clock.tick()
 
         return self
 
-    def update(self) -> np.ndarray:
-        """One of "_cache_update or _no_cache_update"."""
-        raise NotImplementedError("update not implemented for primitive.")
+    def update(self, v) -> node:
+        """Feed the placeholder."""
+        return self.feed(v)
 
-    def __str__(self):
-        """Return string rep of underlying array."""
-        return str(self.v)
+
+def apply_feed(feed: dict):
+    """Feed the placeholders in the dict with their values."""
+    for p, v in feed.items():
+        if not isinstance(p, placeholder):
+            raise ValueError("Can only feed placeholders, got %s" % p.name)
+
+        p.feed(v)
 
 
 class monoid(node):
@@ -228,32 +456,44 @@ class monoid(node):
         self.op: operator.Op = op
         """Forward connections."""
         self.c: [connection] = []
-        """Initially nodes are not cached unless a user calls cache on the graph.
+        """Initially nodes are not cached.
 
+        Unless a user calls cache on the graph.
         So that things can become pre-computed.
         (e.g calculation paths and so on)
         """
         self.output = self._output_no_cache
 
-    def _output_no_cache(self) -> np.ndarray:
+    def _output_no_cache(self, feed: dict = None) -> np.ndarray:
         """Apply op on the inputs."""
-        self.gradient_cached = False
+        if feed:
+            apply_feed(feed)
 
-        return self.op.forward(self.m1.output(), self.m2.output())
+        c = self.op.forward(self.m1.output(), self.m2.output())
+        self.version = max(self.version, self.m1.version, self.m2.version)
+        return c
 
-    def _output_cache(self) -> np.ndarray:
-        """Apply op on inputs if output is not cached."""
-        self.gradient_cached = False
+    def _output_cache(self, feed: dict = None) -> np.ndarray:
+        """Apply op on inputs if an input has a new version."""
+        if feed:
+            apply_feed(feed)
 
-        if self.output_cached:
+        if self.output_cached and self.checked == clock.now:
             return self.output_cache
 
-        self.output_cached = True
-        self.output_cache = self.op.forward(self.m1.output(), self.m2.output())
+        m1, m2 = self.m1.output(), self.m2.output()
+        seen = max(self.m1.version, self.m2.version)
 
+        if not self.output_cached or seen != self.seen:
+            self.output_cached = True
+            self.output_cache = self.op.forward(m1, m2)
+            self.seen = seen
+            self.version = max(self.version, seen)
+
+        self.checked = clock.now
         return self.output_cache
 
-    def output(self) -> np.ndarray:
+    def output(self, feed: dict = None) -> np.ndarray:
         """One of "output_no_cache or _output_cache"."""
         raise NotImplementedError("output not implemented for monoid.")
 
@@ -261,6 +501,10 @@ class monoid(node):
         """Return shape of monoid operator output."""
         return self.op.shape()
 
+    def dtype(self) -> np.dtype:
+        """Return dtype of monoid operator output."""
+        return self.op.dtype()
+
 
 class functor(node):
     """functor node is a base building block of the graph."""
@@ -276,35 +520,115 @@ class functor(node):
         self.op: operator.Op = op
         """Forward connections."""
         self.c: [connection] = []
-        """Initially nodes are not cached unless a user calls cache on the graph.
+        """Initially nodes are not cached.
 
+        Unless a user calls cache on the graph.
         So that things can become pre-computed.
         (e.g calculation paths and so on)
         """
         self.output = self._output_no_cache
 
-    def _output_no_cache(self) -> np.ndarray:
+    def _output_no_cache(self, feed: dict = None) -> np.ndarray:
         """Apply op on the inputs."""
-        self.gradient_cached = False
+        if feed:
+            apply_feed(feed)
 
-        return self.op.forward(self.m1.output())
+        c = self.op.forward(self.m1.output())
+        self.version = max(self.version, self.m1.version)
+        return c
 
-    def _output_cache(self) -> np.ndarray:
-        """Apply op on inputs if output is not cached."""
-        self.gradient_cached = False
+    def _output_cache(self, feed: dict = None) -> np.ndarray:
+        """Apply op on inputs if the input has a new version."""
+        if feed:
+            apply_feed(feed)
 
-        if self.output_cached:
+        if self.output_cached and self.checked == clock.now:
             return self.output_cache
 
-        self.output_cached = True
-        self.output_cache = self.op.forward(self.m1.output())
+        m1 = self.m1.output()
+        seen = self.m1.version
 
+        if not self.output_cached or seen != self.seen:
+            self.output_cached = True
+            self.output_cache = self.op.forward(m1)
+            self.seen = seen
+            self.version = max(self.version, seen)
+
+        self.checked = clock.now
         return self.output_cache
 
-    def output(self) -> np.ndarray:
+    def output(self, feed: dict = None) -> np.ndarray:
         """One of "output_no_cache or _output_cache"."""
         raise NotImplementedError("output not implemented for functor.")
 
     def shape(self) -> tuple:
         """Return shape of monoid operator output."""
         return self.op.shape()
+
+    def dtype(self) -> np.dtype:
+        """Return dtype of functor operator output."""
+        return self.op.dtype()
+
+
+class fused(node):
+    """fused node calculates a chain of elementwise nodes as one."""
+
+    def __init__(self, inputs: [node], op: operator.Op, name: str = None):
+        """Fused: the inputs of the chain and the fused op."""
+        if name is None:
+            super().__init__(tensorjo.naming.get_node_name(op.name()))
+        else:
+            super().__init__(name)
+
+        self.inputs: [node] = inputs
+        self.op: operator.Op = op
+        """Forward connections."""
+        self.c: [connection] = []
+        """Initially nodes are not cached.
+
+        Unless a user calls cache on the graph.
+        So that things can become pre-computed.
+        (e.g calculation paths and so on)
+        """
+        self.output = self._output_no_cache
+
+    def _output_no_cache(self, feed: dict = None) -> np.ndarray:
+        """Apply op on the inputs."""
+        if feed:
+            apply_feed(feed)
+
+        c = self.op.forward(*[m.output() for m in self.inputs])
+        self.version = max([self.version] + [m.version for m in self.inputs])
+        return c
+
+    def _output_cache(self, feed: dict = None) -> np.ndarray:
+        """Apply op on inputs if an input has a new version."""
+        if feed:
+            apply_feed(feed)
+
+        if self.output_cached and self.checked == clock.now:
+            return self.output_cache
+
+        inputs = [m.output() for m in self.inputs]
+        seen = max(m.version for m in self.inputs)
+
+        if not self.output_cached or seen != self.seen:
+            self.output_cached = True
+            self.output_cache = self.op.forward(*inputs)
+            self.seen = seen
+            self.version = max(self.version, seen)
+
+        self.checked = clock.now
+        return self.output_cache
+
+    def output(self, feed: dict = None) -> np.ndarray:
+        """One of "output_no_cache or _output_cache"."""
+        raise NotImplementedError("output not implemented for fused.")
+
+    def shape(self) -> tuple:
+        """Return shape of fused operator output."""
+        return self.op.shape()
+
+    def dtype(self) -> np.dtype:
+        """Return dtype of fused operator output."""
+        return self.op.dtype()
@@ -19,6 +19,16 @@ class Op():
     argument to the forward pass
     """
 
+    # Elementwise ops implement forward_out and can be fused, see the
+    # fused op.
+    elementwise = False
+
+    # What the backward pass reads, the positions of the inputs (None
+    # for all) and whether it reads the output. Arrays of other values
+    # can be reused once the forward pass is done with them.
+    saved_inputs = None
+    saved_output = True
+
     @abstractmethod
     def forward(self, *args) -> np.ndarray:
         """Forward pass in the graph.
@@ -27,6 +37,39 @@ class Op():
         """
         pass
 
+    def forward_out(self, *args, out: np.ndarray) -> np.ndarray:
+        """Forward pass in the graph writing the output into out.
+
+        out can be one of the inputs, then the remembered input is
+        overwritten.
+        """
+        raise NotImplementedError("forward_out is not implemented.")
+
+    def key(self):
+        """Identify what the op calculates.
+
+        Two ops with the same key give the same output for the same
+        inputs, ops with parameters should include them.
+        """
+        return type(self)
+
+    def forward_batched(self, *args) -> np.ndarray:
+        """Forward pass in the graph over a batch along the first axis.
+
+        All inputs have the same number of dimensions and the batch
+        axis first, of size one if the input is the same for the whole
+        batch. Elementwise ops broadcast so this is the forward pass.
+        """
+        return self.forward(*args)
+
+    def tangent(self, *tangents) -> np.ndarray:
+        """Forward mode pass in the graph.
+
+        Returns the tangent of the output given the tangents of the
+        inputs to the latest forward pass.
+        """
+        raise NotImplementedError("tangent is not implemented.")
+
     def backward_functor(self) -> np.ndarray:
         """Backward pass in the graph.
 
@@ -48,6 +91,65 @@ class Op():
         """
         raise NotImplementedError("Backward_second is not implemented.")
 
+    def symbolic_functor(self, n: "node.node") -> "node.node":
+        """Backward pass as a graph.
+
+        Returns a node calculating the gradient wrt to the input of the
+        functor node n.
+        """
+        raise NotImplementedError("symbolic_functor is not implemented.")
+
+    def symbolic_first(self, n: "node.node") -> "node.node":
+        """Backward pass as a graph.
+
+        Returns a node calculating the gradients of first wrt the output
+        of the monoid node n.
+        """
+        raise NotImplementedError("symbolic_first is not implemented.")
+
+    def symbolic_second(self, n: "node.node") -> "node.node":
+        """Backward pass as a graph.
+
+        Returns a node calculating the gradients of second wrt the output
+        of the monoid node n.
+        """
+        raise NotImplementedError("symbolic_second is not implemented.")
+
+    def source(self, *args) -> str:
+        """Forward pass as python source.
+
+        args are the names of the inputs, returns an expression
+        calculating the output.
+        """
+        raise NotImplementedError("source is not implemented.")
+
+    def source_functor(self, m1: str, c: str) -> str:
+        """Backward pass as python source.
+
+        m1 and c are the names of the input and the output of the
+        functor, returns an expression calculating the gradient wrt
+        the input.
+        """
+        raise NotImplementedError("source_functor is not implemented.")
+
+    def source_first(self, m1: str, m2: str, c: str) -> str:
+        """Backward pass as python source.
+
+        m1, m2 and c are the names of the inputs and the output of the
+        monoid, returns an expression calculating the gradients of
+        first wrt output.
+        """
+        raise NotImplementedError("source_first is not implemented.")
+
+    def source_second(self, m1: str, m2: str, c: str) -> str:
+        """Backward pass as python source.
+
+        m1, m2 and c are the names of the inputs and the output of the
+        monoid, returns an expression calculating the gradients of
+        second wrt output.
+        """
+        raise NotImplementedError("source_second is not implemented.")
+
     @abstractmethod
     def cache(self) -> np.ndarray:
         """Return output from previous forward pass."""
@@ -58,6 +160,11 @@ class Op():
         """Return the output shape of this op."""
         pass
 
+    @abstractmethod
+    def dtype(self) -> np.dtype:
+        """Return the output dtype of this op."""
+        pass
+
     @abstractmethod
     def name(self) -> str:
         """Name of the op."""
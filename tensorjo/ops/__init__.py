@@ -7,6 +7,10 @@ from . import mse
 from . import sigmoid
 from . import sin
 from . import cos
+from . import reduction
+from . import ones
+from . import normalise
+from . import fused
 
 addition = addition.addition
 subtraction = subtraction.subtraction
@@ -15,5 +19,9 @@ multiplication = multiplication.multiplication
 sin = sin.sin
 cos = cos.cos
 mse = mse.mse
+reduction = reduction.reduction
+ones = ones.ones
+normalise = normalise.normalise
+fused = fused.fused
 
 sigmoid = sigmoid.sigmoid
@@ -1,4 +1,5 @@
 """This files defines the normal addition op."""
+import tensorjo
 from tensorjo import op
 import numpy as np
 
@@ -6,6 +7,10 @@ import numpy as np
 class addition(op.Op):
     """This class implements the forward and backward pass for addition."""
 
+    elementwise = True
+    saved_inputs = ()
+    saved_output = False
+
     def __init__(self, m1: np.ndarray, m2: np.ndarray):
         """Initialize op."""
         super()
@@ -22,6 +27,7 @@ class addition(op.Op):
         self.m2 = m2
 
         self.c = m1 + m2
+        self.output_dtype = self.c.dtype
 
     def forward(self, m1: np.ndarray, m2: np.ndarray) -> np.ndarray:
         """Implement the forward pass of the op."""
@@ -30,6 +36,18 @@ class addition(op.Op):
         self.c = m1 + m2
         return self.c
 
+    def forward_out(self, m1: np.ndarray, m2: np.ndarray,
+                    out: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op into out."""
+        self.m1 = m1
+        self.m2 = m2
+        self.c = np.add(m1, m2, out=out)
+        return self.c
+
+    def tangent(self, t1: np.ndarray, t2: np.ndarray) -> np.ndarray:
+        """Implement the forward mode pass of the op."""
+        return t1 + t2
+
     def backward_first(self) -> np.ndarray:
         """Implement the backward pass of first tensor."""
         return np.ones_like(self.m1)
@@ -38,13 +56,37 @@ class addition(op.Op):
         """Implement the backward pass of second tensor."""
         return np.ones_like(self.m2)
 
+    def symbolic_first(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of first tensor as a graph."""
+        return tensorjo.tensor(1, dtype=n.dtype())
+
+    def symbolic_second(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of second tensor as a graph."""
+        return tensorjo.tensor(1, dtype=n.dtype())
+
+    def source(self, m1: str, m2: str) -> str:
+        """Implement the forward pass of the op as source."""
+        return "%s + %s" % (m1, m2)
+
+    def source_first(self, m1: str, m2: str, c: str) -> str:
+        """Implement the backward pass of first tensor as source."""
+        return "1"
+
+    def source_second(self, m1: str, m2: str, c: str) -> str:
+        """Implement the backward pass of second tensor as source."""
+        return "1"
+
     def cache(self) -> np.ndarray:
         """Return output from previous forward pass."""
         return self.c
 
     def shape(self):
-        """Return the shape of the forward pass."""
-        return self.output_shape
+        """Return the shape of the latest forward pass."""
+        return np.shape(self.c)
+
+    def dtype(self):
+        """Return the dtype of the forward pass."""
+        return self.output_dtype
 
     def name(self):
         """Return name of addition op."""
@@ -1,4 +1,5 @@
 """This files defines the normal cos op."""
+import tensorjo
 from tensorjo import op
 import numpy as np
 
@@ -11,6 +12,10 @@ def s(x):
 class cos(op.Op):
     """This class implements the forward and backward pass for cos."""
 
+    elementwise = True
+    saved_inputs = (0,)
+    saved_output = False
+
     def __init__(self, m1: np.ndarray):
         """Initialize op."""
         super()
@@ -24,6 +29,7 @@ class cos(op.Op):
 
         self.m1 = np.array(m1, copy=True)
         self.c = s(np.array(m1, copy=True))
+        self.output_dtype = self.c.dtype
 
     def forward(self, m1: np.ndarray) -> np.ndarray:
         """Implement the forward pass of the op."""
@@ -31,17 +37,44 @@ class cos(op.Op):
         self.c = s(m1)
         return self.c
 
+    def forward_out(self, m1: np.ndarray,
+                    out: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op into out."""
+        self.m1 = m1
+        self.c = np.cos(m1, out=out)
+        return self.c
+
+    def tangent(self, t: np.ndarray) -> np.ndarray:
+        """Implement the forward mode pass of the op."""
+        return -np.sin(self.m1) * t
+
     def backward_functor(self) -> np.ndarray:
         """Implement the backward pass of first tensor."""
         return -np.sin(self.m1)
 
+    def symbolic_functor(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of first tensor as a graph."""
+        return tensorjo.sin(n.m1) * -1
+
+    def source(self, m1: str) -> str:
+        """Implement the forward pass of the op as source."""
+        return "np.cos(%s)" % m1
+
+    def source_functor(self, m1: str, c: str) -> str:
+        """Implement the backward pass of first tensor as source."""
+        return "-np.sin(%s)" % m1
+
     def cache(self) -> np.ndarray:
         """Return output from previous forward pass."""
         return self.c
 
     def shape(self):
-        """Return the shape of the forward pass."""
-        return self.output_shape
+        """Return the shape of the latest forward pass."""
+        return np.shape(self.c)
+
+    def dtype(self):
+        """Return the dtype of the forward pass."""
+        return self.output_dtype
 
     def name(self):
         """Return name of cos op."""
@@ -1,4 +1,5 @@
 """This files defines the normal multiplication op."""
+import tensorjo
 from tensorjo import op
 import numpy as np
 
@@ -6,6 +7,10 @@ import numpy as np
 class division(op.Op):
     """Implements the forward and backward pass for division."""
 
+    elementwise = True
+    saved_inputs = (0, 1)
+    saved_output = False
+
     # To avoid zero divison
     tiny_number = 1e-15
 
@@ -25,6 +30,7 @@ class division(op.Op):
         self.m2 = m2
 
         self.c = m1 / (m2 + division.tiny_number)
+        self.output_dtype = self.c.dtype
 
     def forward(self, m1: np.ndarray, m2: np.ndarray) -> np.ndarray:
         """Implement the forward pass of the op."""
@@ -35,6 +41,25 @@ class division(op.Op):
         self.c = m1 / (m2 + division.tiny_number)
         return self.c
 
+    def forward_out(self, m1: np.ndarray, m2: np.ndarray,
+                    out: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op into out."""
+        self.m1 = m1
+        self.m2 = m2
+
+        if m1 is out:
+            self.c = np.divide(m1, m2 + division.tiny_number, out=out)
+        else:
+            np.add(m2, division.tiny_number, out=out)
+            self.c = np.divide(m1, out, out=out)
+
+        return self.c
+
+    def tangent(self, t1: np.ndarray, t2: np.ndarray) -> np.ndarray:
+        """Implement the forward mode pass of the op."""
+        return t1 / (self.m2 + division.tiny_number)\
+            - self.m1 * t2 / (self.m2 * self.m2 + division.tiny_number)
+
     def backward_first(self) -> np.ndarray:
         """Implement the backward pass of first tensor."""
         return np.ones_like(self.m1) / (self.m2 + division.tiny_number)
@@ -43,13 +68,37 @@ class division(op.Op):
         """Implement the backward pass of second tensor."""
         return -self.m1 / (self.m2 * self.m2 + division.tiny_number)
 
+    def symbolic_first(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of first tensor as a graph."""
+        return tensorjo.div(1, n.m2)
+
+    def symbolic_second(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of second tensor as a graph."""
+        return tensorjo.div(n.m1 * -1, n.m2 * n.m2)
+
+    def source(self, m1: str, m2: str) -> str:
+        """Implement the forward pass of the op as source."""
+        return "%s / (%s + %r)" % (m1, m2, division.tiny_number)
+
+    def source_first(self, m1: str, m2: str, c: str) -> str:
+        """Implement the backward pass of first tensor as source."""
+        return "1 / (%s + %r)" % (m2, division.tiny_number)
+
+    def source_second(self, m1: str, m2: str, c: str) -> str:
+        """Implement the backward pass of second tensor as source."""
+        return "-%s / (%s * %s + %r)" % (m1, m2, m2, division.tiny_number)
+
     def cache(self) -> np.ndarray:
         """Return output from previous forward pass."""
         return self.c
 
     def shape(self):
-        """Return the shape of the forward pass."""
-        return (self.m1 / (self.m2 + division.tiny_number)).shape
+        """Return the shape of the latest forward pass."""
+        return np.shape(self.c)
+
+    def dtype(self):
+        """Return the dtype of the forward pass."""
+        return self.output_dtype
 
     def name(self):
         """Return name of division op."""
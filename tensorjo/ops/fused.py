@@ -0,0 +1,211 @@
+"""This files defines the fused op."""
+import tensorjo
+from tensorjo import op
+import numpy as np
+
+
+class fused(op.Op):
+    """A chain of elementwise ops calculated as one op.
+
+    The steps are the ops of the chain, inputs first, and the indices
+    of their arguments. Index i < arity is the i'th input of the fused
+    op, index arity + j is the output of step j. Every step consumes the
+    output of at most one step so that the chain can be calculated in
+    the output buffer without temporaries.
+
+    Only the inputs and the output are remembered. The backward pass
+    calculates the chain again with the ops of the steps and sweeps it
+    backwards to get the gradients of the output wrt every input.
+    """
+
+    elementwise = True
+    saved_inputs = None
+    saved_output = False
+
+    def __init__(self, steps: [(op.Op, (int, ))], arity: int):
+        """Initialize op."""
+        super()
+
+        self.steps = steps
+        self.arity = arity
+
+        last = self.steps[-1][0]
+        self.output_dtype = last.dtype()
+
+        self.inputs = None
+        self.c = last.cache()
+        self.gradients = None
+
+    def key(self):
+        """Identify the op by the ops of the steps and their arguments."""
+        return (type(self),
+                tuple((step.key(), args) for step, args in self.steps))
+
+    def forward(self, *inputs) -> np.ndarray:
+        """Implement the forward pass of the op."""
+        shape = np.broadcast(*inputs).shape
+        return self.forward_out(
+            *inputs, out=np.empty(shape, dtype=self.output_dtype))
+
+    def forward_out(self, *inputs, out: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op into out.
+
+        out can not be one of the inputs.
+        """
+        self.inputs = inputs
+        self.gradients = None
+
+        values = list(inputs)
+        for step, args in self.steps:
+            values.append(
+                step.forward_out(*[values[i] for i in args], out=out))
+
+        self.c = out
+        return self.c
+
+    def chain(self) -> [np.ndarray]:
+        """Calculate the chain again with the ops of the steps.
+
+        Returns the inputs followed by the outputs of the steps, the
+        ops of the steps hold the state of this forward pass.
+        """
+        values = list(self.inputs)
+        for step, args in self.steps:
+            values.append(step.forward(*[values[i] for i in args]))
+
+        return values
+
+    def tangent(self, *tangents) -> np.ndarray:
+        """Implement the forward mode pass of the op."""
+        self.chain()
+
+        ts = list(tangents)
+        for step, args in self.steps:
+            ts.append(step.tangent(*[ts[i] for i in args]))
+
+        return ts[-1]
+
+    def backward(self, k: int) -> np.ndarray:
+        """Implement the backward pass of the k'th input.
+
+        The gradients of all inputs are calculated in one sweep the
+        first time this is called after a forward pass.
+        """
+        if self.gradients is None:
+            self.chain()
+
+            gradients = [None] * (self.arity + len(self.steps))
+            gradients[-1] = np.ones((), dtype=self.output_dtype)
+
+            for j in reversed(range(len(self.steps))):
+                step, args = self.steps[j]
+                upstream = gradients[self.arity + j]
+
+                if len(args) == 1:
+                    derivatives = [step.backward_functor()]
+                else:
+                    derivatives = [
+                        step.backward_first(),
+                        step.backward_second()
+                    ]
+
+                for i, derivative in zip(args, derivatives):
+                    if gradients[i] is None:
+                        gradients[i] = upstream * derivative
+                    else:
+                        gradients[i] = gradients[i] + upstream * derivative
+
+            self.gradients = gradients
+
+        return self.gradients[k]
+
+    def symbolic_input(self, n: "node.node", k: int) -> "node.node":
+        """Implement the backward pass of the k'th input as a graph.
+
+        The chain is added to the graph unfused to differentiate it.
+        """
+        nodes = list(n.inputs)
+        for step, args in self.steps:
+            a = [nodes[i] for i in args]
+            if len(a) == 1:
+                nodes.append(tensorjo.graph.apply_functor(a[0], type(step)))
+            else:
+                nodes.append(
+                    tensorjo.graph.apply_monoid(a[0], a[1], type(step)))
+
+        gradients = [None] * len(nodes)
+        gradients[-1] = tensorjo.tensor(1, dtype=n.dtype())
+
+        for j in reversed(range(len(self.steps))):
+            args = self.steps[j][1]
+            m = nodes[self.arity + j]
+            upstream = gradients[self.arity + j]
+
+            if len(args) == 1:
+                derivatives = [m.op.symbolic_functor(m)]
+            else:
+                derivatives = [m.op.symbolic_first(m), m.op.symbolic_second(m)]
+
+            for i, derivative in zip(args, derivatives):
+                if gradients[i] is None:
+                    gradients[i] = upstream * derivative
+                else:
+                    gradients[i] = gradients[i] + upstream * derivative
+
+        return gradients[k]
+
+    def source(self, *inputs: str) -> str:
+        """Implement the forward pass of the op as source."""
+        return self.expressions(inputs)[-1]
+
+    def source_input(self, k: int, inputs: [str], c: str) -> str:
+        """Implement the backward pass of the k'th input as source."""
+        expressions = self.expressions(inputs)
+        expressions[-1] = c
+
+        gradients = [[] for _ in expressions]
+        gradients[-1] = ["1"]
+
+        for j in reversed(range(len(self.steps))):
+            step, args = self.steps[j]
+            upstream = " + ".join(gradients[self.arity + j])
+
+            a = [expressions[i] for i in args]
+            out = expressions[self.arity + j]
+            if len(args) == 1:
+                derivatives = [step.source_functor(a[0], out)]
+            else:
+                derivatives = [
+                    step.source_first(a[0], a[1], out),
+                    step.source_second(a[0], a[1], out)
+                ]
+
+            for i, derivative in zip(args, derivatives):
+                gradients[i].append("(%s) * (%s)" % (upstream, derivative))
+
+        return " + ".join(gradients[k])
+
+    def expressions(self, inputs: [str]) -> [str]:
+        """Get the source of the inputs followed by the steps."""
+        expressions = list(inputs)
+        for step, args in self.steps:
+            expressions.append(
+                "(%s)" % step.source(*[expressions[i] for i in args]))
+
+        return expressions
+
+    def cache(self) -> np.ndarray:
+        """Return output from previous forward pass."""
+        return self.c
+
+    def shape(self):
+        """Return the shape of the latest forward pass."""
+        return np.shape(self.c)
+
+    def dtype(self):
+        """Return the dtype of the forward pass."""
+        return self.output_dtype
+
+    def name(self):
+        """Return name of fused op."""
+        return "fused"
@@ -1,4 +1,5 @@
 """This files defines the MSE op."""
+import tensorjo
 from tensorjo import op
 import numpy as np
 
@@ -6,6 +7,9 @@ import numpy as np
 class mse(op.Op):
     """This class implements the forward and backward pass for mse."""
 
+    saved_inputs = (0, 1)
+    saved_output = False
+
     def __init__(self, m1: np.ndarray, m2: np.ndarray):
         """Initialize op."""
         super()
@@ -21,7 +25,11 @@ class mse(op.Op):
         self.m1 = m1
         self.m2 = m2
 
+        # Number of elements the mean is over
+        self.size = np.broadcast(m1, m2).size
+
         self.c = np.mean(np.square(m1 - m2))
+        self.output_dtype = self.c.dtype
 
     def forward(self, m1: np.ndarray, m2: np.ndarray) -> np.ndarray:
         """Implement the forward pass of the op."""
@@ -29,27 +37,89 @@ class mse(op.Op):
         # for the gradient calculations
         self.m1 = m1
         self.m2 = m2
+        self.size = np.broadcast(m1, m2).size
         self.c = np.mean(np.square(m1 - m2))
 
         return self.c
 
+    def forward_batched(self, m1: np.ndarray, m2: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op over a batch.
+
+        The mean is over all but the batch axis.
+        """
+        self.m1 = m1
+        self.m2 = m2
+
+        difference = m1 - m2
+        self.size = difference.size // difference.shape[0]
+        self.c = np.mean(np.square(difference),
+                         axis=tuple(range(1, difference.ndim)),
+                         keepdims=True)
+
+        return self.c
+
+    def tangent(self, t1: np.ndarray, t2: np.ndarray) -> np.ndarray:
+        """Implement the forward mode pass of the op.
+
+        The mean is over the axes of the inputs, leading axes of the
+        tangents are kept.
+        """
+        difference = self.m1 - self.m2
+        t = 2 * difference / difference.size * (t1 - t2)
+
+        return np.sum(t, axis=tuple(range(t.ndim - difference.ndim, t.ndim)))
+
     def backward_first(self) -> np.ndarray:
         """Implement the backward pass of first tensor."""
         difference = self.m1 - self.m2
-        return 2 * difference
+        return 2 * difference / self.size
 
     def backward_second(self) -> np.ndarray:
         """Implement the backward pass of second tensor."""
         difference = self.m1 - self.m2
-        return -2 * difference
+        return -2 * difference / self.size
+
+    def symbolic_first(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of first tensor as a graph.
+
+        The number of elements is taken at run time.
+        """
+        difference = n.m1 - n.m2
+        return tensorjo.graph.apply_functor(difference,
+                                            tensorjo.ops.normalise) * 2
+
+    def symbolic_second(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of second tensor as a graph.
+
+        The number of elements is taken at run time.
+        """
+        difference = n.m1 - n.m2
+        return tensorjo.graph.apply_functor(difference,
+                                            tensorjo.ops.normalise) * -2
+
+    def source(self, m1: str, m2: str) -> str:
+        """Implement the forward pass of the op as source."""
+        return "np.mean(np.square(%s - %s))" % (m1, m2)
+
+    def source_first(self, m1: str, m2: str, c: str) -> str:
+        """Implement the backward pass of first tensor as source."""
+        return "2 * (%s - %s) / np.size(%s - %s)" % (m1, m2, m1, m2)
+
+    def source_second(self, m1: str, m2: str, c: str) -> str:
+        """Implement the backward pass of second tensor as source."""
+        return "-2 * (%s - %s) / np.size(%s - %s)" % (m1, m2, m1, m2)
 
     def cache(self) -> np.ndarray:
         """Return output from previous forward pass."""
         return self.c
 
     def shape(self):
-        """Return the shape of the forward pass."""
-        return self.output_shape
+        """Return the shape of the latest forward pass."""
+        return np.shape(self.c)
+
+    def dtype(self):
+        """Return the dtype of the forward pass."""
+        return self.output_dtype
 
     def name(self):
         """Return name of mse op."""
@@ -0,0 +1,76 @@
+"""This files defines the normalise op."""
+import tensorjo
+from tensorjo import op
+import numpy as np
+
+
+class normalise(op.Op):
+    """Divides a tensor by its number of elements.
+
+    The number of elements is taken at run time so that gradients of
+    means follow the shape, e.g of a placeholder.
+    """
+
+    saved_inputs = (0,)
+    saved_output = False
+
+    def __init__(self, m1: np.ndarray):
+        """Initialize op."""
+        super()
+
+        self.m1 = m1
+        self.c = m1 / np.size(m1)
+        self.output_shape = np.shape(self.c)
+        self.output_dtype = self.c.dtype
+
+    def forward(self, m1: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op."""
+        self.m1 = m1
+        self.c = m1 / np.size(m1)
+        return self.c
+
+    def forward_batched(self, m1: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op over a batch.
+
+        Every entry is divided by its own number of elements.
+        """
+        self.m1 = m1
+        self.c = m1 / (np.size(m1) // np.shape(m1)[0])
+        return self.c
+
+    def tangent(self, t: np.ndarray) -> np.ndarray:
+        """Implement the forward mode pass of the op."""
+        return t / np.size(self.m1)
+
+    def backward_functor(self) -> np.ndarray:
+        """Implement the backward pass of first tensor."""
+        return np.full_like(self.m1, 1 / np.size(self.m1))
+
+    def symbolic_functor(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of first tensor as a graph."""
+        return tensorjo.graph.apply_functor(
+            tensorjo.graph.apply_functor(n.m1, tensorjo.ops.ones), normalise)
+
+    def source(self, m1: str) -> str:
+        """Implement the forward pass of the op as source."""
+        return "%s / np.size(%s)" % (m1, m1)
+
+    def source_functor(self, m1: str, c: str) -> str:
+        """Implement the backward pass of first tensor as source."""
+        return "np.full_like(%s, 1 / np.size(%s))" % (m1, m1)
+
+    def cache(self) -> np.ndarray:
+        """Return output from previous forward pass."""
+        return self.c
+
+    def shape(self):
+        """Return the shape of the latest forward pass."""
+        return np.shape(self.c)
+
+    def dtype(self):
+        """Return the dtype of the forward pass."""
+        return self.output_dtype
+
+    def name(self):
+        """Return name of normalise op."""
+        return "normalise"
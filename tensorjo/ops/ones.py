@@ -0,0 +1,66 @@
+"""This files defines the ones op."""
+import tensorjo
+from tensorjo import op
+import numpy as np
+
+
+class ones(op.Op):
+    """Ones of the shape of the input.
+
+    Gradients that depend on the shape of a tensor use this so that they
+    follow the shape at run time, e.g of a placeholder.
+    """
+
+    saved_inputs = (0,)
+    saved_output = False
+
+    def __init__(self, m1: np.ndarray):
+        """Initialize op."""
+        super()
+
+        self.m1 = m1
+        self.c = np.ones_like(m1)
+        self.output_shape = self.c.shape
+        self.output_dtype = self.c.dtype
+
+    def forward(self, m1: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op."""
+        self.m1 = m1
+        self.c = np.ones_like(m1)
+        return self.c
+
+    def tangent(self, t: np.ndarray) -> np.ndarray:
+        """Implement the forward mode pass of the op."""
+        return np.zeros(np.broadcast(t, self.c).shape, dtype=self.output_dtype)
+
+    def backward_functor(self) -> np.ndarray:
+        """Implement the backward pass of first tensor."""
+        return np.zeros_like(self.m1)
+
+    def symbolic_functor(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of first tensor as a graph."""
+        return tensorjo.tensor(0, dtype=n.dtype())
+
+    def source(self, m1: str) -> str:
+        """Implement the forward pass of the op as source."""
+        return "np.ones_like(%s)" % m1
+
+    def source_functor(self, m1: str, c: str) -> str:
+        """Implement the backward pass of first tensor as source."""
+        return "np.zeros_like(%s)" % m1
+
+    def cache(self) -> np.ndarray:
+        """Return output from previous forward pass."""
+        return self.c
+
+    def shape(self):
+        """Return the shape of the latest forward pass."""
+        return np.shape(self.c)
+
+    def dtype(self):
+        """Return the dtype of the forward pass."""
+        return self.output_dtype
+
+    def name(self):
+        """Return name of ones op."""
+        return "ones"
@@ -0,0 +1,103 @@
+"""This files defines the reduction op."""
+import tensorjo
+from tensorjo import op
+from tensorjo import backprop
+import numpy as np
+
+
+class reduction(op.Op):
+    """Sums a tensor over the axes it was broadcast along.
+
+    The output has the target shape. This is what gradients go through
+    when their input was broadcast in the forward pass.
+    """
+
+    saved_inputs = ()
+    saved_output = False
+
+    def __init__(self, m1: np.ndarray, shape: tuple):
+        """Initialize op."""
+        super()
+
+        self.target = tuple(shape)
+
+        self.output_shape = None
+        try:
+            self.output_shape = backprop.reduce_to(m1, self.target).shape
+        except ValueError as e:
+            raise ValueError(
+                "Failed to construct reduction op with tensor %s to shape %s "
+                % (m1, shape) + "- %s" % e)
+
+        self.m1 = m1
+        self.c = backprop.reduce_to(m1, self.target)
+        self.output_dtype = self.c.dtype
+
+    def key(self):
+        """Identify the op by the target shape."""
+        return (type(self), self.target)
+
+    def forward(self, m1: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op."""
+        self.m1 = m1
+        self.c = backprop.reduce_to(m1, self.target)
+        return self.c
+
+    def forward_batched(self, m1: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op over a batch.
+
+        The batch axis is kept.
+        """
+        self.m1 = m1
+
+        axes = backprop.broadcast_axes(m1.shape[1:], self.target)
+        self.c = np.sum(m1, axis=tuple(1 + a for a in axes), keepdims=True)
+        return self.c
+
+    def tangent(self, t: np.ndarray) -> np.ndarray:
+        """Implement the forward mode pass of the op.
+
+        Leading axes of the tangent are kept.
+        """
+        t = np.broadcast_to(t, np.broadcast(t, self.m1).shape)
+
+        leading = t.ndim - np.ndim(self.m1)
+        axes = backprop.broadcast_axes(np.shape(self.m1), self.target)
+
+        t = np.sum(t, axis=tuple(leading + a for a in axes), keepdims=True)
+        if leading == 0:
+            return t.reshape(self.target)
+
+        return t
+
+    def backward_functor(self) -> np.ndarray:
+        """Implement the backward pass of first tensor."""
+        return np.ones_like(self.m1)
+
+    def symbolic_functor(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of first tensor as a graph."""
+        return tensorjo.graph.apply_functor(n.m1, tensorjo.ops.ones)
+
+    def source(self, m1: str) -> str:
+        """Implement the forward pass of the op as source."""
+        return "reduce_to(%s, %r)" % (m1, self.target)
+
+    def source_functor(self, m1: str, c: str) -> str:
+        """Implement the backward pass of first tensor as source."""
+        return "np.ones_like(%s)" % m1
+
+    def cache(self) -> np.ndarray:
+        """Return output from previous forward pass."""
+        return self.c
+
+    def shape(self):
+        """Return the shape of the latest forward pass."""
+        return np.shape(self.c)
+
+    def dtype(self):
+        """Return the dtype of the forward pass."""
+        return self.output_dtype
+
+    def name(self):
+        """Return name of reduction op."""
+        return "reduction"
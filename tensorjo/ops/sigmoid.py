@@ -11,6 +11,10 @@ def s(x):
 class sigmoid(op.Op):
     """This class implements the forward and backward pass for sigmoid."""
 
+    elementwise = True
+    saved_inputs = ()
+    saved_output = True
+
     def __init__(self, m1: np.ndarray):
         """Initialize op."""
         super()
@@ -24,6 +28,7 @@ class sigmoid(op.Op):
 
         self.m1 = np.array(m1, copy=True)
         self.c = s(np.array(m1, copy=True))
+        self.output_dtype = self.c.dtype
 
     def forward(self, m1: np.ndarray) -> np.ndarray:
         """Implement the forward pass of the op."""
@@ -31,17 +36,47 @@ class sigmoid(op.Op):
         self.c = s(m1)
         return self.c
 
+    def forward_out(self, m1: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """Implement the forward pass of the op into out."""
+        self.m1 = m1
+
+        np.negative(m1, out=out)
+        np.exp(out, out=out)
+        np.add(out, 1, out=out)
+        self.c = np.divide(1, out, out=out)
+        return self.c
+
+    def tangent(self, t: np.ndarray) -> np.ndarray:
+        """Implement the forward mode pass of the op."""
+        return self.c * (1 - self.c) * t
+
     def backward_functor(self) -> np.ndarray:
         """Implement the backward pass of first tensor."""
         return self.c * (1 - self.c)
 
+    def symbolic_functor(self, n: "node.node") -> "node.node":
+        """Implement the backward pass of first tensor as a graph."""
+        return n * (1 - n)
+
+    def source(self, m1: str) -> str:
+        """Implement the forward pass of the op as source."""
+        return "1 / (1 + np.exp(-%s))" % m1
+
+    def source_functor(self, m1: str, c: str) -> str:
+        """Implement the backward pass of first tensor as source."""
+        return "%s * (1 - %s)" % (c, c)
+
     def cache(self) -> np.ndarray:
         """Return output from previous forward pass."""
         return self.c
 
     def shape(self):
-        """Return the shape of the forward pass."""
-        return self.output_shape
+        """Return the shape of the latest forward pass."""
+        return np.shape(self.c)
+
+    def dtype(self):
+        """Return the dtype of the forward pass."""
+        return self.output_dtype
 
     def name(self):
         """Return name of sigmoid op."""
@@ -5,7 +5,15 @@ import numpy as np
 
 
 class gd(optimiser.optimiser):
-    """Gradient Optimiser."""
+    """Gradient Optimiser.
+
+    The variables are updated in place. The steps are calculated in
+    scratch buffers of the optimiser, the gradient buffers of the graph
+    are never written to.
+
+    When the variables are the packed variables of the graph, all of
+    them are updated at once on the flat buffers, see graph.pack.
+    """
 
     def __init__(self, master: "node.node"):
         """Initialise the optimiser with node optimising against."""
@@ -18,18 +26,39 @@ class gd(optimiser.optimiser):
         """Rounds to optimise."""
         self.rounds = 100
 
+        """Step of every variable, reused between steps."""
+        self.scratch = {}
+
+    def step(self, nodes: ["node.node"], maximise: bool = False) -> None:
+        """Take one gradient step."""
+        packing = tensorjo.tjgraph.packing
+        if packing is not None and packing.covers(nodes):
+            self._step(packing, packing.gradients(self.master), maximise)
+            return
+
+        grads = tensorjo.gradients(self.master, nodes)
+        for n, g in zip(nodes, grads):
+            self._step(n, g, maximise)
+
+    def _step(self, n, g: np.ndarray, maximise: bool) -> None:
+        """Update a variable, or a packing, with its gradient."""
+        scratch = self.scratch.get(n)
+        if scratch is None or scratch.shape != g.shape:
+            scratch = self.scratch[n] = np.empty_like(g)
+
+        np.multiply(g, self.dt, out=scratch)
+
+        if maximise:
+            n.assign_add(scratch)
+        else:
+            n.assign_sub(scratch)
+
     def maximise(self, nodes: ["node.node"]) -> None:
         """Maximise op."""
-        cache = list(enumerate(nodes))
         for i in range(self.rounds):
-            grads = tensorjo.gradients(self.master, nodes)
-            for i, n in cache:
-                n.update(n.v + np.mean(grads[i]) * self.dt)
+            self.step(nodes, maximise=True)
 
     def minimise(self, nodes: ["node.node"]) -> None:
         """Minimise op."""
-        cache = list(enumerate(nodes))
         for i in range(self.rounds):
-            grads = tensorjo.gradients(self.master, nodes)
-            for i, n in cache:
-                n.update(n.v - np.mean(grads[i]) * self.dt)
+            self.step(nodes)
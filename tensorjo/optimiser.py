@@ -1,6 +1,9 @@
 """This module defines the structure of the op in the graph."""
 from abc import abstractmethod
+from . import node
+from . import stream
 import numpy as np
+import time
 
 
 class optimiser():
@@ -20,3 +23,51 @@ class optimiser():
     def minimise(self, nodes: ["node.node"]) -> [np.ndarray]:
         """Minimise self with respect to the nodes."""
         raise NotImplementedError("minimise is not implemented.")
+
+    @abstractmethod
+    def step(self, nodes: ["node.node"], maximise: bool = False) -> None:
+        """Take one optimisation step with respect to the nodes."""
+        raise NotImplementedError("step is not implemented.")
+
+    def train(self,
+              nodes: ["node.node"],
+              batches,
+              placeholders: ["node.placeholder"] = None,
+              maximise: bool = False,
+              prefetch: int = 2) -> stream.statistics:
+        """Take one step per batch of an iterable, e.g a generator.
+
+        A batch is a dict from placeholders to values or a sequence of
+        values of the placeholders. The batches are loaded by a
+        background thread at most prefetch batches ahead.
+
+        Returns the statistics of the pass, call it once per epoch.
+        """
+        stats = stream.statistics()
+        loader = stream.prefetch(batches, size=prefetch)
+
+        start = time.perf_counter()
+        try:
+            for batch in loader:
+                if isinstance(batch, dict):
+                    feed = batch
+                    batch = list(batch.values())
+                elif placeholders is None:
+                    raise ValueError("Batches need placeholders to be fed to")
+                elif len(batch) != len(placeholders):
+                    raise ValueError("Got %s values for %s placeholders" %
+                                     (len(batch), len(placeholders)))
+                else:
+                    feed = dict(zip(placeholders, batch))
+
+                node.apply_feed(feed)
+                self.step(nodes, maximise=maximise)
+
+                stats.add(batch)
+        finally:
+            loader.close()
+
+        stats.seconds = time.perf_counter() - start
+        stats.waited = loader.waited
+
+        return stats
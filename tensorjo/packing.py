@@ -0,0 +1,104 @@
+"""This module packs the variables of a graph into one buffer.
+
+The values of the variables are copied into one contiguous array and
+every variable is left with a view into it. Their gradients are gathered
+the same way by the backprop plans, see plan.flat. An optimiser can then
+update all variables with a few numpy calls on the flat arrays instead
+of a python loop over the variables, and a checkpoint is one array.
+
+Updates of a packed variable are written into its view so that it stays
+packed.
+"""
+from . import backprop
+from . import node
+import numpy as np
+
+
+class packing():
+    """The variables of a graph in one flat buffer."""
+
+    def __init__(self, variables: ["node.primitive"]):
+        """Copy the values of the variables into the buffer."""
+        self.variables = list(variables)
+
+        dtypes = {p.dtype() for p in self.variables}
+        if len(dtypes) > 1:
+            raise ValueError("Cannot pack variables of dtypes %s together" %
+                             sorted(str(d) for d in dtypes))
+
+        dtype = dtypes.pop() if dtypes else np.float32
+        self.buffer = np.empty(sum(p.v.size for p in self.variables),
+                               dtype=dtype)
+
+        start = 0
+        for p in self.variables:
+            view = self.buffer[start:start + p.v.size].reshape(p.v.shape)
+            view[...] = p.v
+
+            p.v = view
+            p.owned = True
+            p.packed = True
+
+            start += p.v.size
+
+    def covers(self, nodes: ["node.node"]) -> bool:
+        """Check if the nodes are exactly the packed variables."""
+        return len(nodes) == len(self.variables) and \
+            set(nodes) == set(self.variables)
+
+    def gradients(self, output: "node.node") -> np.ndarray:
+        """Get the gradients of the output wrt the packed variables.
+
+        The gradients are laid out as the buffer. The array is a read
+        only view of the buffer of the plan, it changes the next time
+        the plan runs.
+        """
+        plan = backprop.get_plan([output], self.variables)
+
+        flat = plan.flat()
+        plan.evaluate()
+
+        return backprop.read_only(flat)
+
+    def update(self, v) -> "packing":
+        """Write v, e.g a checkpoint of the buffer, into the buffer."""
+        v = np.asarray(v, dtype=self.buffer.dtype)
+
+        if v.shape != self.buffer.shape:
+            raise ValueError("Cannot update packing of shape %s with %s" %
+                             (self.buffer.shape, v.shape))
+
+        self._check(v)
+        self.buffer[...] = v
+        self._changed()
+
+        return self
+
+    def assign_add(self, delta: np.ndarray) -> "packing":
+        """Add delta to the buffer in place."""
+        self._check(delta)
+        np.add(self.buffer, delta, out=self.buffer)
+        self._changed()
+
+        return self
+
+    def assign_sub(self, delta: np.ndarray) -> "packing":
+        """Subtract delta from the buffer in place."""
+        self._check(delta)
+        np.subtract(self.buffer, delta, out=self.buffer)
+        self._changed()
+
+        return self
+
+    def _check(self, v: np.ndarray):
+        """Check v if any of the variables is strictly validated."""
+        for p in self.variables:
+            if p.policy() == "strict":
+                p.check(np.asarray(v))
+                return
+
+    def _changed(self):
+        """Give all variables a new version after the buffer changed."""
+        version = node.clock.tick()
+        for p in self.variables:
+            p.version = version
@@ -0,0 +1,145 @@
+"""This module streams batches of data into the graph.
+
+Batches are loaded by a background thread into a bounded queue so that
+loading the next batch overlaps with calculating the gradients of the
+current one. The queue bounds how far ahead the thread loads, and with
+that how many batches are held in memory at once.
+
+An error raised while loading is raised again where the batches are
+consumed.
+
+Arrays larger than memory, e.g np.memmaps wrapped without copying, can
+be split in chunks that are views and streamed the same way.
+"""
+from . import node
+import numpy as np
+import threading
+import queue
+import time
+
+# Kinds of items put on the queue
+_batch, _end, _error = range(3)
+
+
+class prefetch():
+    """Iterate batches loaded ahead by a background thread."""
+
+    def __init__(self, batches, size: int = 2):
+        """Start loading the batches of an iterable, size ahead."""
+        if size < 1:
+            raise ValueError("Cannot prefetch %s batches" % size)
+
+        self.queue = queue.Queue(maxsize=size)
+        self.stopped = threading.Event()
+        self.done = False
+
+        # Seconds spent waiting for the thread
+        self.waited = 0.0
+
+        self.thread = threading.Thread(target=self._load,
+                                       args=(iter(batches), ),
+                                       daemon=True)
+        self.thread.start()
+
+    def _load(self, batches):
+        """Put the batches on the queue until done or stopped."""
+        try:
+            for b in batches:
+                if not self._put((_batch, b)):
+                    return
+
+            self._put((_end, None))
+        except Exception as e:
+            self._put((_error, e))
+
+    def _put(self, item) -> bool:
+        """Put an item on the queue unless stopped while waiting."""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def __iter__(self):
+        """Return the iterator."""
+        return self
+
+    def __next__(self):
+        """Get the next batch, waiting for the thread if needed."""
+        if self.done:
+            raise StopIteration
+
+        start = time.perf_counter()
+        kind, item = self.queue.get()
+        self.waited += time.perf_counter() - start
+
+        if kind == _batch:
+            return item
+
+        self.close()
+        if kind == _error:
+            raise item
+
+        raise StopIteration
+
+    def close(self):
+        """Stop loading batches."""
+        self.done = True
+        self.stopped.set()
+
+
+def chunks(tensors: list, size: int):
+    """Iterate aligned chunks of tensors or arrays along the first axis.
+
+    Every tensor must have the same number of entries. The chunks are
+    views so a np.memmap is only read one chunk at a time.
+    """
+    arrays = [t.output() if isinstance(t, node.node) else t for t in tensors]
+
+    entries = {np.shape(a)[0] if np.ndim(a) else None for a in arrays}
+    if len(entries) != 1 or None in entries:
+        raise ValueError("Cannot chunk arrays of shapes %s together" %
+                         [np.shape(a) for a in arrays])
+
+    if size < 1:
+        raise ValueError("Cannot split arrays in chunks of %s" % size)
+
+    for start in range(0, entries.pop(), size):
+        yield tuple(a[start:start + size] for a in arrays)
+
+
+class statistics():
+    """Throughput of one pass over a stream of batches."""
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.batches = 0
+        self.examples = 0
+
+        # Wall time of the pass and the part of it spent waiting for data
+        self.seconds = 0.0
+        self.waited = 0.0
+
+    def add(self, batch: [np.ndarray]):
+        """Count a batch, its leading axis are the examples."""
+        self.batches += 1
+
+        shape = np.shape(batch[0]) if batch else ()
+        self.examples += shape[0] if shape else 1
+
+    def throughput(self) -> float:
+        """Return the examples per second."""
+        if self.seconds == 0:
+            return 0.0
+
+        return self.examples / self.seconds
+
+    def __str__(self):
+        """Return a summary of the pass."""
+        return "%s batches, %s examples in %.3fs (%.1f examples/s, " \
+            "%.3fs waiting for data)" % (self.batches, self.examples,
+                                         self.seconds, self.throughput(),
+                                         self.waited)
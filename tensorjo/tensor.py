@@ -4,23 +4,73 @@ import tensorjo
 from . import node
 
 
-def tensor(v, name: str = None):
-    """Convert thing to okay tensor format."""
+def tensor(v,
+           name: str = None,
+           dtype: np.dtype = None,
+           copy: bool = True,
+           validation: str = None):
+    """Convert thing to okay tensor format.
+
+    The dtype defaults to the dtype of the graph, which is float32.
+
+    If not copy, v must be an array of the dtype, e.g a np.memmap, and
+    is wrapped as it is. The dtype then defaults to the dtype of v.
+
+    validation is the policy of the tensor, see graph.set_validation,
+    by default the graph policy is used.
+    """
     if isinstance(v, node.node):
         return v
 
+    if validation is not None:
+        node.check_validation(validation)
+
+    check = (validation or tensorjo.tjgraph.validation) != "off"
+
+    if not copy:
+        return _wrap(v, name, dtype, validation, check)
+
+    if dtype is None:
+        dtype = tensorjo.tjgraph.dtype
+
     try:
-        v = np.array(v, dtype=np.float32)
+        v = np.array(v, dtype=dtype)
     except Exception as e:
         raise ValueError("Unable to convert %s to float array" % v)
 
     if len(v.shape) > 0 and v.shape[0] == 0:
         raise ValueError("Empty tensor is not allowed.")
 
-    if np.isnan(v).any():
+    if check and node.has_nan(v):
         raise ValueError("Invalid tensor -- Contains NaN or None.")
 
     if name is None:
         name = tensorjo.naming.get_tensor_name()
 
-    return node.primitive(v, name)
+    return node.primitive(v, name, validation=validation, owned=True)
+
+
+def _wrap(v, name: str, dtype: np.dtype, validation: str,
+          check: bool) -> "node.mapped":
+    """Wrap an array without copying it."""
+    if not isinstance(v, np.ndarray):
+        raise ValueError("Can only wrap arrays without copying, got %s" %
+                         type(v).__name__)
+
+    if dtype is not None and v.dtype != dtype:
+        raise ValueError("Cannot wrap array of %s as %s without copying" %
+                         (v.dtype, np.dtype(dtype)))
+
+    if v.dtype.kind != "f":
+        raise ValueError("Cannot wrap array of %s, it is not float" % v.dtype)
+
+    if len(v.shape) > 0 and v.shape[0] == 0:
+        raise ValueError("Empty tensor is not allowed.")
+
+    if check and node.has_nan(v):
+        raise ValueError("Invalid tensor -- Contains NaN or None.")
+
+    return node.mapped(v,
+                       name or tensorjo.naming.get_tensor_name(),
+                       validation=validation,
+                       owned=True)
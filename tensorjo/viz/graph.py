@@ -55,7 +55,7 @@ class visualizer():
                 "text": [],
                 "size": []
             }
-            for n in ['primitive', 'functor', 'monoid', "output"]
+            for n in ['primitive', 'functor', 'monoid', 'fused', "output"]
         }
 
         for i, n in enumerate(graph.nodes):
@@ -75,6 +75,10 @@ class visualizer():
                 c = "red"
                 t = "monoid"
 
+            if isinstance(n, tj.fused):
+                c = "orange"
+                t = "fused"
+
             text = "name: %s --- output: %s --- type: %s" % (n.name, o, t)
 
             if n == master:
@@ -190,6 +194,10 @@ def build_graph(nodes: ["node.node"]) -> "networkx.Graph":
         if isinstance(n, tj.functor):
             dag.add_edge(n.m1, n)
 
+        if isinstance(n, tj.fused):
+            for m in n.inputs:
+                dag.add_edge(m, n)
+
     return dag
 
 
@@ -204,6 +212,13 @@ def trace(master: "node.node") -> ["node.node"]:
         if isinstance(node, tj.primitive):
             return
 
+        if isinstance(node, tj.fused):
+            for m in node.inputs:
+                if m not in nodes:
+                    dfs(m)
+
+            return
+
         if node.m1 in nodes:
             return
 
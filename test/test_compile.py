@@ -0,0 +1,192 @@
+"""Compiler module."""
+import tensorjo as tj
+import numpy as np
+import logging
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+ok_numerical_error = 1e-6
+
+
+def _true(item):
+    try:
+        return all(np.array(item).reshape(-1))
+    except Exception as e:
+        return item
+
+
+def test_compile():
+    """Test that programs give the same results as output."""
+    a = tj.var(np.random.rand(5))
+    b = tj.var(np.random.rand())
+    x = np.arange(0, 5)
+
+    o = tj.sigmoid(a * x + b)
+    err = tj.mse(x, tj.sin(o) / tj.cos(b) - a)
+
+    LOGGER.info("Testing a compiled node.")
+    program = tj.compile(err)
+    assert _true(abs(program() - err.output()) < ok_numerical_error),\
+        "Program gave %s expected %s" % (program(), err.output())
+
+    LOGGER.info("Testing that programs see updated values.")
+    a.update(np.random.rand(5))
+    assert _true(abs(program() - err.output()) < ok_numerical_error),\
+        "Program gave %s expected %s" % (program(), err.output())
+
+    LOGGER.info("Testing a compiled list of nodes.")
+    program = tj.compile([o, err])
+    for p, n in zip(program(), [o, err]):
+        assert _true(abs(p - n.output()) < ok_numerical_error),\
+            "Program gave %s expected %s" % (p, n.output())
+
+    LOGGER.info("Testing gradients after running a program.")
+    program = tj.compile(err)
+
+    a.update(np.random.rand(5))
+    program()
+    h = tj.backprop.backward(err, [a, b])
+    g = tj.gradients(err, [a, b])
+    for gv, hv in zip(g, h):
+        assert _true(abs(gv - hv) < ok_numerical_error),\
+            "Gradient after program %s should be %s" % (hv, gv)
+
+
+def test_compile_benchmark():
+    """Compare a program with output on a 10k node graph of scalar ops."""
+    a = tj.var(np.random.rand())
+    b = tj.var(np.random.rand())
+
+    # Many short chains so that output stays within the stack
+    timestamp = time.time()
+    chains = []
+    for _ in range(100):
+        c = a
+        for _ in range(50):
+            c = c * b + a
+
+        chains.append(c)
+
+    o = chains[0]
+    for c in chains[1:]:
+        o = o + c
+
+    LOGGER.info("Making graph with %s nodes took %s seconds" %
+                (len(tj.graph.get_ancestors(o)), time.time() - timestamp))
+
+    iters = 20
+
+    # The fastest iteration is compared, it is the least noisy
+    output_times = []
+    for _ in range(iters):
+        timestamp = time.time()
+        o.output()
+        output_times.append(time.time() - timestamp)
+
+    output_time = sum(output_times)
+    LOGGER.info("Running %s iters of output took %s seconds" %
+                (iters, output_time))
+
+    timestamp = time.time()
+    program = tj.compile(o)
+
+    LOGGER.info("Compiling took %s seconds" % (time.time() - timestamp))
+
+    program_times = []
+    for _ in range(iters):
+        timestamp = time.time()
+        program()
+        program_times.append(time.time() - timestamp)
+
+    program_time = sum(program_times)
+    LOGGER.info("Running %s iters of the program took %s seconds" %
+                (iters, program_time))
+
+    LOGGER.info("Speedup: %s" % (output_time / program_time))
+
+    assert abs(program() - o.output()) < 1e-3,\
+        "Program gave %s expected %s" % (program(), o.output())
+
+    assert min(program_times) <= min(output_times),\
+        "Program should not be slower than output, took %s vs %s seconds" %\
+        (min(program_times), min(output_times))
+
+
+def test_generate():
+    """Test that generated functions give the same results as the graph."""
+    a = tj.var(np.random.rand(5, 3))
+    b = tj.var(np.random.rand(3))
+    c = tj.var(np.random.rand())
+    x = tj.tensor(np.random.rand(5, 3))
+
+    err = tj.mse(tj.sigmoid(a * x + b) / (tj.sin(b) + 2),
+                 tj.cos(x) - tj.reduce(a, (1, 3)))
+
+    LOGGER.info("Testing a generated node.")
+    program = tj.generate(err)
+    assert _true(abs(program() - err.output()) < ok_numerical_error),\
+        "Program gave %s expected %s" % (program(), err.output())
+
+    LOGGER.info("Testing that generated functions are cached.")
+    assert program is tj.generate(err)
+
+    LOGGER.info("Testing generated gradients.")
+    program = tj.generate(err, [a, b, c])
+    a.update(np.random.rand(5, 3))
+
+    value, gradients = program()
+    assert _true(abs(value - err.output()) < ok_numerical_error),\
+        "Program gave %s expected %s" % (value, err.output())
+
+    for gv, hv in zip(gradients, tj.gradients(err, [a, b, c])):
+        assert gv.shape == hv.shape and gv.dtype == hv.dtype,\
+            "Generated gradient %s should be %s" % (gv, hv)
+        assert _true(abs(gv - hv) < ok_numerical_error),\
+            "Generated gradient %s should be %s" % (gv, hv)
+
+    LOGGER.info("Testing that the written source runs on its own.")
+    namespace = {}
+    exec(program.source, namespace)
+    value, _ = namespace["program"]([p.v for p in program.primitives])
+    assert _true(abs(value - err.output()) < ok_numerical_error),\
+        "Written program gave %s expected %s" % (value, err.output())
+
+
+def test_memory_plan():
+    """Test that programs with planned memory give the same results."""
+    a = tj.var(np.random.rand(100))
+    b = tj.var(np.random.rand(100))
+    x = tj.tensor(np.random.rand(100))
+
+    h = a * x + b
+    for _ in range(10):
+        h = tj.sigmoid(h + b) - x
+
+    err = tj.mse(h, x)
+
+    LOGGER.info("Testing a program with planned memory.")
+    program = tj.compile(err, reuse=True, keep=[h])
+    LOGGER.info("Planned %s bytes for %s bytes of intermediates" %
+                (program.planned_bytes, program.intermediate_bytes))
+
+    assert program.planned_bytes < program.intermediate_bytes,\
+        "Planned %s bytes should be less than %s bytes" %\
+        (program.planned_bytes, program.intermediate_bytes)
+
+    for _ in range(2):
+        a.update(np.random.rand(100))
+        assert _true(abs(program() - err.output()) < ok_numerical_error),\
+            "Program gave %s expected %s" % (program(), err.output())
+
+    LOGGER.info("Testing fetching kept nodes.")
+    assert _true(abs(program.fetch(h) - h.output()) < ok_numerical_error),\
+        "Kept node is %s expected %s" % (program.fetch(h), h.output())
+
+    LOGGER.info("Testing gradients after running the program.")
+    g = [v.copy() for v in tj.gradients(err, [a, b])]
+
+    program()
+    for gv, hv in zip(g, tj.backprop.backward(err, [a, b])):
+        assert _true(abs(gv - hv) < ok_numerical_error),\
+            "Gradient after program %s should be %s" % (hv, gv)
@@ -2,9 +2,12 @@
 import tensorjo as tj
 import numpy as np
 import logging
+import sys
 
 LOGGER = logging.getLogger(__name__)
 
+ok_numerical_error = 1e-6
+
 
 def _true(item):
     try:
@@ -227,3 +230,562 @@ def test_convex():
 
         assert _true(
             abs(a.v) < 1.0), "A should be smaller than 1 but is %s" % a
+
+
+def test_deep_graph():
+    """Test gradients of a graph deeper than the python stack."""
+    LOGGER.info("Testing gradients of a deep chain: c = c + a * b")
+    a = tj.var(2)
+    b = tj.var(3)
+
+    depth = 3000
+    c = a * b
+    for _ in range(depth - 1):
+        c = c + a * b
+
+    assert depth > sys.getrecursionlimit(),\
+        "Graph should be deeper than the python stack"
+
+    g = tj.gradients(c, [a, b])
+
+    assert abs(g[0] - depth * 3) < ok_numerical_error,\
+        "Gradient wrt a should be %s is %s" % (depth * 3, g[0])
+    assert abs(g[1] - depth * 2) < ok_numerical_error,\
+        "Gradient wrt b should be %s is %s" % (depth * 2, g[1])
+
+    LOGGER.info("Testing gradients wrt many variables in one sweep.")
+    vs = [tj.var(i) for i in range(10)]
+
+    c = vs[0]
+    for v in vs[1:]:
+        c = c * v
+
+    g = tj.gradients(c, vs)
+    for i, v in enumerate(vs[1:]):
+        assert abs(g[i + 1] - c.output() / v.v) < ok_numerical_error,\
+            "Gradient wrt %s should be %s is %s"\
+            % (i + 1, c.output() / v.v, g[i + 1])
+
+
+def test_plan_cache():
+    """Test that backward plans are reused until the graph changes."""
+    a = tj.var(2)
+    b = tj.var(3)
+
+    c = a * b
+
+    g = tj.gradients(c, [a, b])
+    plan = tj.backprop.get_plan([c], [a, b])
+
+    LOGGER.info("Testing that the plan is reused.")
+    for _ in range(3):
+        a.update(a.v + 1)
+        g = tj.gradients(c, [a, b])
+
+        assert tj.backprop.get_plan([c], [a, b]) is plan,\
+            "Plan should be reused when the graph is unchanged"
+
+    assert abs(g[0] - 3) < ok_numerical_error,\
+        "Gradient wrt a should be 3 is %s" % g[0]
+    assert abs(g[1] - 5) < ok_numerical_error,\
+        "Gradient wrt b should be 5 is %s" % g[1]
+
+    LOGGER.info("Testing that adding nodes invalidates the plan.")
+    d = c * a
+
+    assert tj.backprop.get_plan([c], [a, b]) is not plan,\
+        "Plan should be rebuilt after the graph changed"
+
+    g = tj.gradients(d, [a])
+    assert abs(g[0] - 2 * 5 * 3) < ok_numerical_error,\
+        "Gradient wrt a should be 30 is %s" % g[0]
+
+
+def test_broadcast_gradients():
+    """Test that variables get gradients of their own shape."""
+    LOGGER.info("Testing scalar variables broadcast against data.")
+    x = np.arange(0, 10)
+    y = x + 5
+
+    a = tj.var(1)
+    b = tj.var(2)
+
+    err = tj.mse(y, a * x + b)
+    g = tj.gradients(err, [a, b])
+
+    difference = (a.v * x + b.v) - y
+    correct = [np.mean(2 * difference * x), np.mean(2 * difference)]
+    for v, gv, c in zip([a, b], g, correct):
+        assert gv.shape == v.shape(),\
+            "Gradient shape %s should be %s" % (gv.shape, v.shape())
+        assert abs(gv - c) < 1e-3, "Gradient %s should be %s" % (gv, c)
+
+    LOGGER.info("Testing variables broadcast along a kept axis.")
+    a = tj.var(np.ones((5, 1)))
+    b = tj.var(np.ones((1, 4)) * 2)
+    c = tj.var(np.ones(4) * 3)
+
+    d = a * b + c
+    g = tj.gradients(d, [a, b, c])
+
+    for v, gv, correct in zip([a, b, c], g, [8, 5, 5]):
+        assert gv.shape == v.shape(),\
+            "Gradient shape %s should be %s" % (gv.shape, v.shape())
+        assert _true(abs(gv - correct) < ok_numerical_error),\
+            "Gradient %s should be %s" % (gv, correct)
+
+
+def test_no_dtype_promotion():
+    """Test that no op in the graph promotes the dtype."""
+    monoids = ["add", "sub", "mul", "div", "mse"]
+    functors = ["sigmoid", "sin", "cos"]
+
+    for dtype in [np.float32, np.float64]:
+        LOGGER.info("Testing ops keep dtype %s" % dtype.__name__)
+        a = tj.var(np.random.rand(5), dtype=dtype)
+        b = tj.var(np.random.rand(), dtype=dtype)
+
+        outputs = [getattr(tj, op)(a, b) for op in monoids]
+        outputs += [getattr(tj, op)(a) for op in functors]
+
+        for o in outputs:
+            assert o.dtype() == dtype,\
+                "%s should be %s is %s" % (o.name, dtype, o.dtype())
+            assert o.output().dtype == dtype,\
+                "output of %s should be %s is %s"\
+                % (o.name, dtype, o.output().dtype)
+
+            for g in tj.gradients(o, [a, b]):
+                assert g.dtype == dtype,\
+                    "gradient of %s should be %s is %s"\
+                    % (o.name, dtype, g.dtype)
+
+        a.update(np.random.rand(5))
+        assert a.v.dtype == dtype,\
+            "update should keep %s but gave %s" % (dtype, a.v.dtype)
+
+    LOGGER.info("Testing opting in to float64 on the graph.")
+    tj.tjgraph.dtype = np.float64
+    try:
+        a = tj.var(np.random.rand())
+        o = tj.sigmoid(a * 2 + 1)
+        g = tj.gradients(o, [a])
+
+        assert a.v.dtype == np.float64,\
+            "variable should be float64 is %s" % a.v.dtype
+        assert g[0].dtype == np.float64,\
+            "gradient should be float64 is %s" % g[0].dtype
+    finally:
+        tj.tjgraph.dtype = np.float32
+
+
+def test_gradient_buffers():
+    """Test that gradients are accumulated into reused buffers."""
+    a = tj.var(np.ones(5))
+    b = tj.var(2)
+
+    c = a * b + a * a + b
+
+    buffers = tj.gradients(c, [a, b])
+
+    for i in range(3):
+        a.update(np.ones(5) * i)
+        g = tj.gradients(c, [a, b])
+
+        assert all(np.shares_memory(gv, bv) for gv, bv in zip(g, buffers)),\
+            "Gradients should be written into the same buffers"
+
+        assert _true(abs(g[0] - (b.v + 2 * a.v)) < ok_numerical_error),\
+            "Gradient wrt a should be %s is %s" % (b.v + 2 * a.v, g[0])
+        # b is broadcast over the 5 elements of a in both its uses
+        assert abs(g[1] - (np.sum(a.v) + 5)) < ok_numerical_error,\
+            "Gradient wrt b should be %s is %s" % (np.sum(a.v) + 5, g[1])
+
+
+def test_read_only_gradients():
+    """Test that callers can not change the cached gradients."""
+    a = tj.var(1)
+    b = tj.var(2)
+
+    c = a * b + b
+
+    LOGGER.info("Testing gradients can not be written to.")
+    g = tj.gradients(c, [a, b])
+    try:
+        g[0] *= 100
+        assert False, "Gradients should be read only"
+    except ValueError:
+        pass
+
+    g = tj.gradients(c, [a, b])
+    assert abs(g[0] - 2) < ok_numerical_error,\
+        "Gradient wrt a should be 2 is %s" % g[0]
+    assert abs(g[1] - 2) < ok_numerical_error,\
+        "Gradient wrt b should be 2 is %s" % g[1]
+
+    LOGGER.info("Testing products of vjp can not be written to.")
+    g = tj.vjp([c, a * a], [a, b])
+    assert not any(gv.flags.writeable for gv in g),\
+        "Products should be read only"
+
+
+def test_pruned_backward():
+    """Test that only nodes on a path to the output are visited."""
+    a = tj.var(np.ones(3))
+    b = tj.var(2)
+    c = tj.var(4)
+
+    trunk = a * b
+    head_1 = tj.sin(trunk)
+    head_2 = tj.cos(trunk) * c
+
+    g = tj.gradients(head_1, [a, c])
+    plan = tj.backprop.get_plan([head_1], [a, c])
+
+    LOGGER.info("Testing that the other head is skipped.")
+    assert head_2 not in plan.nodes,\
+        "Nodes not feeding the output should not be in the plan"
+
+    assert len(plan.nodes) == 4,\
+        "Plan should contain a, trunk, head and c but has %s nodes"\
+        % len(plan.nodes)
+
+    LOGGER.info("Testing that disconnected variables get zero.")
+    assert plan.disconnected == [c],\
+        "c should be disconnected but got %s" % plan.disconnected
+
+    assert _true(g[1] == 0), "Disconnected gradient should be 0 is %s" % g[1]
+
+    correct = np.cos(a.v * b.v) * b.v
+    assert _true(abs(g[0] - correct) < ok_numerical_error),\
+        "Gradient wrt a should be %s is %s" % (correct, g[0])
+
+
+def test_gradient_cache():
+    """Test that gradients are cached per output and input versions."""
+    a = tj.var(2)
+    b = tj.var(3)
+    x = np.arange(0, 5)
+
+    loss_1 = tj.mse(x, a * x)
+    loss_2 = tj.mse(x, b * x)
+    loss_3 = loss_1 + loss_2
+
+    plans = [tj.backprop.get_plan([loss], [a, b])
+             for loss in [loss_1, loss_2, loss_3]]
+
+    LOGGER.info("Testing gradients of different losses back to back.")
+    g_1 = [np.array(g) for g in tj.gradients(loss_1, [a, b])]
+    g_2 = [np.array(g) for g in tj.gradients(loss_2, [a, b])]
+    g_3 = [np.array(g) for g in tj.gradients(loss_3, [a, b])]
+
+    assert g_1[1] == 0 and g_2[0] == 0,\
+        "Gradients of one loss should not leak into another"
+    assert g_3[0] == g_1[0] and g_3[1] == g_2[1],\
+        "Gradients of the sum should be %s is %s"\
+        % ([g_1[0], g_2[1]], g_3)
+
+    versions = [p.version for p in plans]
+
+    tj.gradients(loss_1, [a, b])
+    assert plans[0].version == versions[0],\
+        "Gradients of unchanged inputs should be served from cache"
+
+    LOGGER.info("Testing that an update only invalidates affected entries.")
+    a.update(1)
+
+    g_2 = tj.gradients(loss_2, [a, b])
+    assert plans[1].version == versions[1],\
+        "loss_2 does not depend on a and should stay cached"
+
+    g_1 = tj.gradients(loss_1, [a, b])
+    assert plans[0].version != versions[0],\
+        "loss_1 depends on a and should be recalculated"
+
+    correct = np.mean(2 * (a.v * x - x) * x)
+    assert abs(g_1[0] - correct) < 1e-3,\
+        "Gradient wrt a should be %s is %s" % (correct, g_1[0])
+
+    LOGGER.info("Testing the cache can not be changed by the caller.")
+    for g in g_1:
+        try:
+            g *= 100
+            assert False, "Cached gradients should be read only"
+        except ValueError:
+            pass
+
+    version = plans[0].version
+    g_1 = tj.gradients(loss_1, [a, b])
+    assert plans[0].version == version,\
+        "Gradients should still be served from cache"
+    assert abs(g_1[0] - correct) < 1e-3 and g_1[1] == 0,\
+        "Gradients should be %s is %s" % ([correct, 0], g_1)
+
+
+def test_vjp():
+    """Test gradients of several outputs in one backward pass."""
+    a = tj.var(np.ones(3) * 2)
+    b = tj.var(3)
+    x = np.arange(0, 3)
+
+    trunk = tj.sigmoid(a * b)
+    head_1 = tj.mse(x, trunk)
+    head_2 = trunk * x
+
+    LOGGER.info("Testing a weighted multi-loss objective.")
+    g = tj.vjp([head_1, head_2], [a, b], seeds=[np.array(2), np.ones(3)])
+
+    h_1 = tj.gradients(head_1, [a, b])
+    correct_a = 2 * h_1[0] + np.array(tj.gradients(head_2, [a])[0])
+    correct_b = 2 * h_1[1] + np.array(tj.gradients(head_2, [b])[0])
+
+    assert _true(abs(g[0] - correct_a) < ok_numerical_error),\
+        "Gradient wrt a should be %s is %s" % (correct_a, g[0])
+    assert abs(g[1] - correct_b) < ok_numerical_error,\
+        "Gradient wrt b should be %s is %s" % (correct_b, g[1])
+
+    LOGGER.info("Testing an output that feeds another output.")
+    c = tj.var(2)
+    d = c * c
+    e = d * 3
+
+    g = tj.vjp([d, e], [c], seeds=[np.array(1), np.array(10)])
+    assert abs(g[0] - (2 * 2 + 10 * 3 * 2 * 2)) < ok_numerical_error,\
+        "Gradient wrt c should be %s is %s" % (2 * 2 + 10 * 3 * 2 * 2, g[0])
+
+    LOGGER.info("Testing default seeds are the sum of the outputs.")
+    g = tj.vjp([d, e], [c])
+    assert abs(g[0] - (2 * 2 + 3 * 2 * 2)) < ok_numerical_error,\
+        "Gradient wrt c should be %s is %s" % (2 * 2 + 3 * 2 * 2, g[0])
+
+    LOGGER.info("Testing shared nodes are calculated once per sweep.")
+    calls = []
+    forward = trunk.op.forward
+
+    def counted(*inputs):
+        calls.append(inputs)
+        return forward(*inputs)
+
+    trunk.op.forward = counted
+    b.update(2)
+
+    tj.vjp([head_1, head_2], [a, b])
+    assert len(calls) == 1,\
+        "Shared trunk should be calculated once is %s times" % len(calls)
+
+
+def test_jvp():
+    """Test directional derivatives of forward mode differentiation."""
+    monoids = ["add", "sub", "mul", "div", "mse"]
+    functors = ["sigmoid", "sin", "cos"]
+
+    a = tj.var(np.random.rand(5) + 1)
+    b = tj.var(np.random.rand() + 1)
+
+    outputs = [getattr(tj, op)(a, b) for op in monoids]
+    outputs += [getattr(tj, op)(a * b) for op in functors]
+
+    t_a = np.random.rand(5)
+    t_b = np.random.rand()
+
+    LOGGER.info("Testing jvp agrees with the vjp of every op.")
+    values, tangents = tj.jvp(outputs, [a, b], [t_a, t_b])
+    for o, value, tangent in zip(outputs, values, tangents):
+        assert tangent.shape == o.shape(),\
+            "Tangent shape %s should be %s" % (tangent.shape, o.shape())
+
+        assert _true(abs(value - o.output()) < ok_numerical_error),\
+            "Value of %s should be %s is %s" % (o.name, o.output(), value)
+
+        for k in range(o.shape()[0] if o.shape() else 1):
+            seed = np.zeros(o.shape())
+            seed[k if o.shape() else ()] = 1
+
+            g = tj.vjp([o], [a, b], seeds=[seed])
+            correct = np.sum(g[0] * t_a) + np.sum(g[1] * t_b)
+            tk = tangent[k] if o.shape() else tangent
+
+            assert abs(tk - correct) < 1e-4,\
+                "Tangent of %s should be %s is %s" % (o.name, correct, tk)
+
+    LOGGER.info("Testing batched tangents.")
+    x = np.arange(0, 4)
+    o = tj.sigmoid(a * b + 1)
+    err = tj.mse(x[:, None], a * x[:, None] + b)
+
+    directions = np.random.rand(3, 5)
+    _, tangents = tj.jvp([o, err], [a], [directions], batched=True)
+
+    assert tangents[0].shape == (3, 5),\
+        "Batched tangent shape should be (3, 5) is %s" % (tangents[0].shape, )
+    assert tangents[1].shape == (3, ),\
+        "Batched tangent shape should be (3, ) is %s" % (tangents[1].shape, )
+
+    for k, d in enumerate(directions):
+        _, single = tj.jvp([o, err], [a], [d])
+        for batch, s in zip(tangents, single):
+            assert _true(abs(batch[k] - s) < ok_numerical_error),\
+                "Batched tangent %s should be %s" % (batch[k], s)
+
+
+def test_vmap():
+    """Test vectorised evaluation against a python loop."""
+    x = tj.tensor(np.arange(0, 4)[:, None] * np.ones((1, 3)))
+
+    a = tj.var(np.random.rand(3))
+    b = tj.var(np.random.rand())
+    c = tj.var(np.random.rand(1, 3))
+
+    o = tj.sigmoid(a * b + c)
+    err = tj.mse(tj.reduce(tj.sin(x * a) + b, (1, 3)), c / b)
+
+    a_values = np.random.rand(6, 3)
+    b_values = np.random.rand(6) + 1
+
+    LOGGER.info("Testing vmap outputs and per entry gradients.")
+    outputs, gradients = tj.vmap([o, err], [a, b], [a_values, b_values],
+                                 primitives=[a, b, c])
+
+    assert outputs[0].shape == (6, 1, 3),\
+        "Stacked output shape should be (6, 1, 3) is %s" % (outputs[0].shape, )
+    assert outputs[1].shape == (6, ),\
+        "Stacked output shape should be (6, ) is %s" % (outputs[1].shape, )
+    assert gradients[2].shape == (6, 1, 3),\
+        "Stacked gradient shape should be (6, 1, 3) is %s" % (
+            gradients[2].shape, )
+
+    a_v, b_v = a.output(), b.output()
+    for k in range(6):
+        a.update(a_values[k])
+        b.update(b_values[k])
+
+        for batch, single in zip(outputs, [o.output(), err.output()]):
+            assert _true(abs(batch[k] - single) < ok_numerical_error),\
+                "Output %s should be %s" % (batch[k], single)
+
+        plain = tj.vjp([o, err], [a, b, c])
+        for batch, single in zip(gradients, plain):
+            assert _true(abs(batch[k] - single) < ok_numerical_error),\
+                "Gradient %s should be %s" % (batch[k], single)
+
+    a.update(a_v)
+    b.update(b_v)
+
+    LOGGER.info("Testing vmap of a single node.")
+    output, (gb, ) = tj.vmap(err, [b], [b_values])
+    assert output.shape == (6, ),\
+        "Stacked output shape should be (6, ) is %s" % (output.shape, )
+
+    for k in range(6):
+        b.update(b_values[k])
+        assert abs(output[k] - err.output()) < ok_numerical_error,\
+            "Output %s should be %s" % (output[k], err.output())
+        assert abs(gb[k] - tj.gradients(err, [b])[0]) < ok_numerical_error,\
+            "Gradient %s should be %s" % (gb[k], tj.gradients(err, [b])[0])
+
+
+def test_symbolic_gradients():
+    """Test gradients built as graphs."""
+    monoids = ["add", "sub", "mul", "div", "mse"]
+    functors = ["sigmoid", "sin", "cos"]
+
+    a = tj.var(np.random.rand(5) + 1)
+    b = tj.var(np.random.rand() + 1)
+
+    outputs = [getattr(tj, op)(a, b) for op in monoids]
+    outputs += [getattr(tj, op)(a * b) for op in functors]
+
+    LOGGER.info("Testing symbolic gradients agree with numeric ones.")
+    for o in outputs:
+        symbols = tj.gradients(o, [a, b], symbolic=True)
+        numeric = tj.gradients(o, [a, b])
+
+        for s, n in zip(symbols, numeric):
+            assert s.shape() == n.shape,\
+                "Symbolic shape %s should be %s" % (s.shape(), n.shape)
+            assert _true(abs(s.output() - n) < 1e-4),\
+                "Symbolic gradient of %s should be %s is %s"\
+                % (o.name, n, s.output())
+
+    LOGGER.info("Testing second order derivatives.")
+    c = tj.var(3)
+    f = c * c * c
+
+    g = tj.gradients(f, [c], symbolic=True)[0]
+    h = tj.gradients(g, [c])[0]
+    assert abs(h - 6 * c.v) < ok_numerical_error,\
+        "Second derivative should be %s is %s" % (6 * c.v, h)
+
+    h = tj.gradients(tj.sin(c), [c], symbolic=True)[0]
+    h = tj.gradients(h, [c], symbolic=True)[0]
+    assert abs(h.output() + np.sin(c.v)) < ok_numerical_error,\
+        "Second derivative should be %s is %s" % (-np.sin(c.v), h.output())
+
+    LOGGER.info("Testing a Hessian-vector product.")
+    x = np.arange(0, 5)
+    err = tj.mse(x, a * a * x + b)
+    v = np.random.rand(5)
+
+    g = tj.gradients(err, [a], symbolic=True)[0]
+    hv = tj.gradients(g * v, [a])[0]
+
+    hessian = np.diag(2 * (6 * a.v * a.v * x * x + 2 * (b.v - x) * x) / 5)
+    assert _true(abs(hv - hessian.dot(v)) < 1e-3),\
+        "Hessian-vector product should be %s is %s" % (hessian.dot(v), hv)
+
+
+def test_placeholders():
+    """Test evaluating one graph on batches of different sizes."""
+    a = tj.var(np.random.rand(3))
+    b = tj.var(np.random.rand())
+
+    batches = []
+    for n in [5, 7, 2]:
+        xv = np.random.rand(n, 3)
+        yv = np.random.rand(n, 1)
+
+        expected = tj.mse(tj.sigmoid(tj.tensor(xv) * a + b), yv)
+        batches.append((xv, yv, expected.output(),
+                        [g.copy() for g in tj.gradients(expected, [a, b])]))
+
+    x = tj.placeholder((None, 3))
+    y = tj.placeholder((None, 1))
+
+    err = tj.mse(tj.sigmoid(x * a + b), y)
+    total = tj.mse(tj.reduce(x * a, (1, 3)), b)
+
+    # Built for the shape of the placeholders before any feed
+    symbolic = tj.gradients(err, [a, b], symbolic=True) +\
+        tj.gradients(total, [a, b], symbolic=True)
+
+    nodes = len(tj.tjgraph.nodes)
+
+    for xv, yv, output, gradients in batches:
+        LOGGER.info("Testing a batch of %s." % len(xv))
+        o = err.output(feed={x: xv, y: yv})
+        assert abs(o - output) < ok_numerical_error,\
+            "Output should be %s is %s" % (output, o)
+
+        g = tj.gradients(err, [a, b], feed={x: xv, y: yv})
+        for gv, hv in zip(g, gradients):
+            assert gv.shape == hv.shape,\
+                "Gradient shape should be %s is %s" % (hv.shape, gv.shape)
+            assert _true(abs(gv - hv) < ok_numerical_error),\
+                "Gradient should be %s is %s" % (hv, gv)
+
+        numeric = [g.copy() for g in tj.gradients(err, [a, b])] +\
+            [g.copy() for g in tj.gradients(total, [a, b])]
+        for s, hv in zip(symbolic, numeric):
+            assert _true(abs(s.output() - hv) < 1e-5),\
+                "Symbolic gradient should be %s is %s" % (hv, s.output())
+
+    assert len(tj.tjgraph.nodes) == nodes,\
+        "Graph should not grow, has %s nodes expected %s" %\
+        (len(tj.tjgraph.nodes), nodes)
+
+    LOGGER.info("Testing feeding the wrong shape.")
+    try:
+        err.output(feed={x: np.random.rand(5, 2)})
+        assert False, "Feeding the wrong shape should fail"
+    except ValueError:
+        pass
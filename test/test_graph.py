@@ -388,3 +388,365 @@ def test_remove():
 
     o = d.output()
     assert d.output() == 10, ("Output should be 5 is %s" % o)
+
+
+def test_cse():
+    """Test the elimination of common subexpressions."""
+    tj.tjgraph.clear()
+
+    a = tj.var(np.random.rand(3))
+    b = tj.var(np.random.rand(3))
+    x = tj.tensor(np.random.rand(3))
+
+    LOGGER.info("Testing building the same expression twice.")
+    tj.tjgraph.cse()
+
+    h1 = tj.sigmoid(a * x + b)
+    h2 = tj.sigmoid(a * x + b)
+    assert h1 is h2, "Same expression should give the same node"
+    assert len(tj.tjgraph.nodes) == 5, "Graph should contain 5 nodes "\
+        + "Graph contains %s nodes" % len(tj.tjgraph.nodes)
+
+    assert tj.reduce(a * x, (1, )) is tj.reduce(a * x, (1, )),\
+        "Same reduction should give the same node"
+    assert tj.reduce(a * x, (1, )) is not tj.reduce(a * x, (3, )),\
+        "Reductions to different shapes should not be merged"
+
+    LOGGER.info("Testing merging duplicates in the graph.")
+    tj.tjgraph.clear()
+    tj.tjgraph.no_cse()
+
+    a = tj.var(np.random.rand(3))
+    b = tj.var(np.random.rand(3))
+    x = tj.tensor(np.random.rand(3))
+
+    h1 = tj.sigmoid(a * x + b)
+    h2 = tj.sigmoid(a * x + b)
+    o = tj.mse(h1 * h1, h2)
+
+    output = o.output()
+    gradients = [g.copy() for g in tj.gradients(o, [a, b])]
+
+    removed = tj.tjgraph.optimize()
+    assert removed == 3, "Should remove 3 nodes removed %s" % removed
+    assert len(tj.tjgraph.nodes) == 7, "Graph should contain 7 nodes "\
+        + "Graph contains %s nodes" % len(tj.tjgraph.nodes)
+
+    assert abs(o.output() - output) < 1e-6,\
+        "Output after optimize should be %s is %s" % (output, o.output())
+
+    for g, h in zip(tj.gradients(o, [a, b]), gradients):
+        assert np.all(np.abs(g - h) < 1e-6),\
+            "Gradient after optimize should be %s is %s" % (h, g)
+
+    LOGGER.info("Testing gradients of merged duplicates raise.")
+    assert abs(h2.output() - h1.output()).max() < 1e-6,\
+        "Merged duplicate should still be evaluated"
+
+    try:
+        tj.gradients(h2, [b])
+        assert False, "Gradients of a removed node should raise"
+    except ValueError:
+        pass
+
+    LOGGER.info("Testing applying ops to merged duplicates raise.")
+    try:
+        tj.sin(h2)
+        assert False, "Applying an op to a removed node should raise"
+    except ValueError:
+        pass
+
+    try:
+        h2 * b
+        assert False, "Applying an op to a removed node should raise"
+    except ValueError:
+        pass
+
+    LOGGER.info("Testing replacing nodes with common subexpressions on.")
+    tj.tjgraph.cse()
+
+    c = tj.sin(a)
+    tj.tjgraph.replace(c, tj.cos(a))
+
+    e = tj.sin(a)
+    assert e is not c, "Replaced node should not be returned"
+
+    expected = np.cos(a.v)
+    assert np.all(np.abs(tj.gradients(e, [a])[0] - expected) < 1e-6),\
+        "Gradient should be %s is %s" % (expected, tj.gradients(e, [a])[0])
+
+    tj.tjgraph.no_cse()
+
+
+def test_fold():
+    """Test folding of nodes that only depend on constants."""
+    tj.tjgraph.clear()
+
+    a = tj.var(np.random.rand(3))
+    x = tj.tensor(np.random.rand(3))
+
+    h = tj.sin(x) * 2 + x
+    o = tj.mse(a * h, tj.cos(x))
+
+    output = o.output()
+    gradients = [g.copy() for g in tj.gradients(o, [a])]
+
+    LOGGER.info("Testing folding the graph.")
+    folded = tj.tjgraph.fold()
+    assert folded == 4, "Should fold 4 nodes folded %s" % folded
+    assert len(tj.tjgraph.nodes) == 3, "Graph should contain 3 nodes "\
+        + "Graph contains %s nodes" % len(tj.tjgraph.nodes)
+
+    assert abs(o.output() - output) < 1e-6,\
+        "Output after fold should be %s is %s" % (output, o.output())
+
+    for g, h in zip(tj.gradients(o, [a]), gradients):
+        assert np.all(np.abs(g - h) < 1e-6),\
+            "Gradient after fold should be %s is %s" % (h, g)
+
+    LOGGER.info("Testing folding nodes as they are added.")
+    c = tj.sigmoid(x) + 1
+    assert isinstance(c, tj.primitive), "Constant node should be folded"
+    expected = 1 / (1 + np.exp(-x.v)) + 1
+    assert np.all(np.abs(c.output() - expected) < 1e-6),\
+        "Folded node should be %s is %s" % (expected, c.output())
+
+    c = tj.sigmoid(a) + 1
+    assert isinstance(c, tj.monoid), "Variable node should not be folded"
+
+    tj.tjgraph.no_fold()
+    c = tj.sigmoid(x)
+    assert isinstance(c, tj.functor), "Nodes should not be folded"
+
+
+def test_fuse():
+    """Test fusing chains of elementwise nodes."""
+    tj.tjgraph.clear()
+
+    a = tj.var(np.random.rand(4, 3))
+    b = tj.var(np.random.rand(3))
+    x = tj.tensor(np.random.rand(4, 3))
+
+    h = tj.sigmoid(a * x + b)
+    o = tj.mse(h / tj.cos(b) - tj.sin(x), x * x)
+
+    output = o.output()
+    gradients = [g.copy() for g in tj.gradients(o, [a, b])]
+    _, tangents = tj.jvp([o], [a], [np.ones((4, 3))])
+
+    LOGGER.info("Testing fusing the graph.")
+    removed = tj.tjgraph.fuse()
+    assert removed == 4, "Should remove 4 nodes removed %s" % removed
+    assert len(tj.tjgraph.nodes) == 7, "Graph should contain 7 nodes "\
+        + "Graph contains %s nodes" % len(tj.tjgraph.nodes)
+
+    f = o.m1
+    assert isinstance(f, tj.fused), "Chain should be fused"
+    assert f.inputs[:3] == [a, x, b], "Fused inputs should start with a, x, b"
+
+    assert abs(o.output() - output) < 1e-6,\
+        "Output after fuse should be %s is %s" % (output, o.output())
+
+    for g, h in zip(tj.gradients(o, [a, b]), gradients):
+        assert np.all(np.abs(g - h) < 1e-6),\
+            "Gradient after fuse should be %s is %s" % (h, g)
+
+    _, fused_tangents = tj.jvp([o], [a], [np.ones((4, 3))])
+    assert abs(fused_tangents[0] - tangents[0]) < 1e-6,\
+        "Tangent after fuse should be %s is %s" % (tangents[0],
+                                                   fused_tangents[0])
+
+    for g, h in zip(tj.gradients(o, [a, b], symbolic=True), gradients):
+        assert np.all(np.abs(g.output() - h) < 1e-6),\
+            "Symbolic gradient after fuse should be %s is %s" % (h, g)
+
+    LOGGER.info("Testing gradients of fused away nodes raise.")
+    tj.tjgraph.clear()
+
+    a = tj.var(1.0)
+    x = tj.tensor(3.0)
+
+    h = a * x
+    o = tj.sigmoid(h)
+    tj.tjgraph.fuse()
+
+    assert h.output() == 3, "Fused away node should still be evaluated"
+    try:
+        tj.gradients(h, [a])
+        assert False, "Gradients of a fused away node should raise"
+    except ValueError:
+        pass
+
+    LOGGER.info("Testing applying ops to fused away nodes raise.")
+    try:
+        h * a
+        assert False, "Applying an op to a fused away node should raise"
+    except ValueError:
+        pass
+
+    LOGGER.info("Testing removing an input of a fused node.")
+    for fuse in [False, True]:
+        tj.tjgraph.clear()
+
+        a = tj.var(np.random.rand(3))
+        b = tj.var(np.random.rand(3))
+        x = tj.tensor(np.ones(3) * 2)
+
+        err = tj.sigmoid(a * x + b)
+        o = err * 2
+
+        if fuse:
+            tj.tjgraph.fuse()
+
+        tj.tjgraph.remove(b)
+        expected = 1 / (1 + np.exp(-a.v * 2)) * 2
+
+        assert np.all(np.abs(o.output() - expected) < 1e-6),\
+            "Output should be %s is %s" % (expected, o.output())
+
+        g = tj.gradients(o, [a])[0]
+        s = expected / 2
+        assert np.all(np.abs(g - s * (1 - s) * 4) < 1e-5),\
+            "Gradient should be %s is %s" % (s * (1 - s) * 4, g)
+
+
+def test_cache_versions():
+    """Test that cached nodes only recalculate when an input changed."""
+    tj.tjgraph.clear()
+
+    a = tj.var(np.random.rand(3))
+    b = tj.var(np.random.rand(3))
+
+    c1 = tj.sin(a) * 2
+    c2 = tj.cos(b) * 3
+    o = c1 + c2
+
+    tj.tjgraph.cache()
+
+    o.output()
+    first, second = c1.output_cache, c2.output_cache
+
+    LOGGER.info("Testing that nothing is recalculated without updates.")
+    o.output()
+    assert c1.output_cache is first and c2.output_cache is second,\
+        "Cached outputs should not be recalculated"
+
+    LOGGER.info("Testing that only nodes depending on updates recalculate.")
+    a.update(np.random.rand(3))
+
+    expected = np.sin(a.v) * 2 + np.cos(b.v) * 3
+    assert np.all(np.abs(o.output() - expected) < 1e-6),\
+        "Output should be %s is %s" % (expected, o.output())
+    assert c1.output_cache is not first, "c1 should be recalculated"
+    assert c2.output_cache is second, "c2 should not be recalculated"
+
+    LOGGER.info("Testing that changing the inputs of a node recalculates.")
+    tj.tjgraph.replace(c2, c1)
+
+    expected = np.sin(a.v) * 2 + np.sin(a.v) * 2
+    assert np.all(np.abs(o.output() - expected) < 1e-6),\
+        "Output should be %s is %s" % (expected, o.output())
+
+    tj.tjgraph.no_cache()
+
+
+def test_cache_mode():
+    """Test that caching stays on for nodes added after cache."""
+    tj.tjgraph.clear()
+    tj.tjgraph.cache()
+
+    a = tj.var(np.random.rand(3))
+    b = tj.var(np.random.rand(3))
+
+    LOGGER.info("Testing adding nodes to a cached graph.")
+    c = tj.sin(a) * b
+    o = c + b
+
+    o.output()
+    first = c.output_cache
+    assert first is not None, "New nodes should be cached"
+
+    b.update(np.random.rand(3))
+    expected = np.sin(a.v) * b.v + b.v
+    assert np.all(np.abs(o.output() - expected) < 1e-6),\
+        "Output should be %s is %s" % (expected, o.output())
+    assert c.output_cache is not first, "c should be recalculated"
+
+    LOGGER.info("Testing removing nodes from a cached graph.")
+    d = tj.sigmoid(a)
+    e = d * b + 1
+
+    assert np.all(np.abs(e.output() - (1 / (1 + np.exp(-a.v)) * b.v + 1)) <
+                  1e-6), "Output of e is wrong %s" % e.output()
+
+    tj.tjgraph.remove(a)
+    assert np.all(np.abs(e.output() - (b.v + 1)) < 1e-6),\
+        "Output after remove should be %s is %s" % (b.v + 1, e.output())
+
+    LOGGER.info("Testing that no_cache turns the mode off.")
+    tj.tjgraph.no_cache()
+    f = tj.sin(b)
+    f.output()
+    assert f.output_cache is None, "Nodes should not be cached"
+
+
+def test_pack():
+    """Test packing the variables into one buffer."""
+    tj.tjgraph.clear()
+
+    x = tj.tensor(np.random.rand(4, 3))
+
+    a = tj.var(np.random.rand(3))
+    b = tj.var(np.random.rand())
+    c = tj.var(np.random.rand(4, 1))
+
+    err = tj.mse(tj.sigmoid(x * a + b) * c, 1)
+
+    values = [a.output().copy(), b.output().copy(), c.output().copy()]
+    gradients = [np.copy(g) for g in tj.gradients(err, [a, b, c])]
+
+    LOGGER.info("Testing variables are views into the buffer.")
+    packing = tj.tjgraph.pack()
+    assert packing.buffer.shape == (8, ),\
+        "Buffer shape should be (8, ) is %s" % (packing.buffer.shape, )
+
+    for p, v in zip([a, b, c], values):
+        assert np.shares_memory(p.output(), packing.buffer),\
+            "%s should be a view into the buffer" % p.name
+        assert np.all(p.output() == v), "%s should be %s" % (p, v)
+
+    a.update(values[0] * 2)
+    assert np.all(packing.buffer[:3] == values[0] * 2),\
+        "Update should be written into the buffer"
+    a.update(values[0])
+
+    LOGGER.info("Testing flat gradients.")
+    flat = packing.gradients(err)
+    expected = np.concatenate([g.reshape(-1) for g in gradients])
+    assert np.all(np.abs(flat - expected) < 1e-6),\
+        "Flat gradients should be %s is %s" % (expected, flat)
+    assert not flat.flags.writeable, "Flat gradients should be read only"
+
+    LOGGER.info("Testing gd steps on the buffer.")
+    opt = tj.opt.gd(err)
+    opt.step([c, b, a])
+
+    assert np.all(np.abs(packing.buffer - (np.concatenate(
+        [v.reshape(-1) for v in values]) - expected * opt.dt)) < 1e-6),\
+        "Step should update the whole buffer"
+
+    before = err.output()
+    opt.minimise([a, b, c])
+    assert err.output() < before, "Error should decrease"
+
+    LOGGER.info("Testing restoring a checkpoint.")
+    checkpoint, saved = packing.buffer.copy(), err.output()
+    opt.minimise([a, b, c])
+
+    packing.update(checkpoint)
+    assert np.all(a.output() == checkpoint[:3]),\
+        "Variables should be restored"
+    assert abs(err.output() - saved) < 1e-6,\
+        "Error should be %s is %s" % (saved, err.output())
+
+    tj.tjgraph.clear()
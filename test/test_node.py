@@ -288,3 +288,71 @@ def test_functor():
             assert o.shape == context["correct"](m).shape,\
                 "Functor shape missmatch %s(%s) should %s but got %s"\
                 % (op, context["correct"].shape, o.shape)
+
+
+def test_assign():
+    """Check in place updates of primitives."""
+    a = tj.var(np.ones(3))
+    b = tj.var(2.0)
+    o = a * b
+
+    v = a.output()
+    tj.tjgraph.cache()
+    try:
+        assert _true(o.output() == 2), "Output should be 2 is %s" % o.output()
+
+        LOGGER.info("Testing assign_sub and assign_add write in place.")
+        a.assign_sub(np.full(3, 0.5, dtype=np.float32))
+        assert a.output() is v, "Array should be written in place"
+        assert _true(o.output() == 1), "Output should be 1 is %s" % o.output()
+
+        a.assign_add(1)
+        assert _true(o.output() == 3), "Output should be 3 is %s" % o.output()
+
+        LOGGER.info("Testing assigning the wrong shape.")
+        try:
+            a.assign_add(np.ones((2, 3)))
+            assert False, "Assigning shape (2, 3) should be invalid"
+        except ValueError:
+            pass
+    finally:
+        tj.tjgraph.no_cache()
+
+    LOGGER.info("Testing gd updates in place and keeps gradient buffers.")
+    err = tj.mse(o, 0)
+    opt = tj.opt.gd(err)
+
+    grads = tj.gradients(err, [a, b])
+    before = [np.copy(g) for g in grads]
+
+    opt.step([a, b])
+
+    assert a.output() is v, "gd should update in place"
+    assert all(_true(g == c) for g, c in zip(grads, before)),\
+        "gd should not write to the gradient buffers"
+    assert _true(a.output() == 1.5 - before[0] * opt.dt),\
+        "Variable should be %s is %s" % (1.5 - before[0] * opt.dt, a)
+
+    LOGGER.info("Testing arrays given to update are not written in place.")
+    online = tj.var(np.ones(3))
+    target = tj.var(np.zeros(3))
+
+    err = tj.mse(online * 2, 0)
+    copy = tj.mse(target * 2, 0)
+    opt = tj.opt.gd(err)
+
+    target.update(online.output())
+    copy_before = copy.output()
+    tj.gradients(copy, [target])
+
+    opt.step([online])
+    assert _true(target.output() == 1),\
+        "Target should be 1 is %s" % target.output()
+    assert not np.shares_memory(online.output(), target.output()),\
+        "Online should have its own array after the step"
+    assert copy.output() == copy_before,\
+        "Output of target should be %s is %s" % (copy_before, copy.output())
+
+    online.update(np.broadcast_to(np.float32(1), (3, )))
+    opt.step([online])
+    assert _true(online.output() < 1), "Broadcast array should be copied"
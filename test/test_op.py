@@ -386,13 +386,13 @@ def test_mse():
         mse_op = tj.ops.mse(m1, m2)
         first_deriv = mse_op.backward_first()
         diff = m1 - m2
-        assert _true(abs(first_deriv - (2 * diff))
+        assert _true(abs(first_deriv - (2 * diff / diff.size))
                      < ok_numerical_error),\
             "derivative of mse(%s, %s) with respect to the first is not %s" \
             % (m1, m2, first_deriv)
 
         second_deriv = mse_op.backward_second()
-        assert _true(abs(second_deriv - (-2 * diff))
+        assert _true(abs(second_deriv - (-2 * diff / diff.size))
                      < ok_numerical_error),\
             "derivative of mse(%s, %s) with respect to the second is not %s" \
             % (m1, m2, second_deriv)
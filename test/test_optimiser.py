@@ -70,3 +70,51 @@ def test_gd_on_logistic_regression():
     LOGGER.info("perfect would be 4 and -1")
     LOGGER.info("predictions %s", np.round(o.output()))
     LOGGER.info("observations %s", np.round(y))
+
+
+def test_gd_on_stream():
+    """Test training on batches from a generator."""
+    a = tj.var(np.random.rand())
+    b = tj.var(np.random.rand())
+
+    x = tj.placeholder((None, ))
+    y = tj.placeholder((None, ))
+
+    err = tj.mse(y, a * x + b)
+
+    def batches(n):
+        for _ in range(n):
+            xs = np.random.rand(16) * 10
+            yield xs, xs + 5
+
+    opt = tj.opt.gd(err)
+
+    LOGGER.info("Training a linear regression on a stream of batches.")
+    for epoch in range(20):
+        stats = opt.train([a, b], batches(50), placeholders=[x, y])
+        LOGGER.info("epoch %s: %s", epoch, stats)
+
+    assert stats.batches == 50, "Should be 50 batches is %s" % stats.batches
+    assert stats.examples == 800,\
+        "Should be 800 examples is %s" % stats.examples
+    assert stats.throughput() > 0, "Throughput should be positive"
+
+    assert abs(a.output() - 1) < 1e-1 and abs(b.output() - 5) < 1e-1,\
+        "Should be 1 and 5 is %s and %s" % (a, b)
+
+    LOGGER.info("Testing batches as dicts.")
+    stats = opt.train([a, b], ({x: xs, y: xs + 5} for xs in np.ones((3, 4))))
+    assert stats.examples == 12,\
+        "Should be 12 examples is %s" % stats.examples
+
+    LOGGER.info("Testing errors while loading are raised.")
+
+    def failing():
+        yield np.ones(4), np.ones(4)
+        raise RuntimeError("loading failed")
+
+    try:
+        opt.train([a, b], failing(), placeholders=[x, y])
+        assert False, "Error while loading should be raised"
+    except RuntimeError:
+        pass
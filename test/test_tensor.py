@@ -5,6 +5,14 @@ import logging
 
 LOGGER = logging.getLogger(__name__)
 
+
+def _true(item):
+    try:
+        return all(np.array(item).reshape(-1))
+    except Exception as e:
+        return item
+
+
 invalid_tensors = [
     "cookie",
     bytes("cookie", encoding="utf8"), "", [], None, lambda x: x, 'a',
@@ -45,5 +53,118 @@ def test_tensor_initialization():
             "%s is supposed to be a valid tensor -- %s" % (t, err)
 
 
+def test_mapped_tensors(tmp_path):
+    """Check wrapping memory mapped arrays without copying."""
+    path = str(tmp_path / "data.bin")
+
+    data = np.memmap(path, dtype=np.float32, mode="w+", shape=(10, 3))
+    data[:] = np.arange(30).reshape(10, 3)
+
+    LOGGER.info("Testing the array is not copied.")
+    t = tj.tensor(data, copy=False)
+    assert isinstance(t, tj.mapped), "Tensor should be mapped"
+    assert np.shares_memory(t.output(), data), "Array should not be copied"
+
+    a = tj.var(np.ones(3))
+    o = tj.reduce(t * a, (3, ))
+    assert _true(o.output() == np.sum(data, axis=0)),\
+        "Output should be %s is %s" % (np.sum(data, axis=0), o.output())
+
+    LOGGER.info("Testing updates are written into the array.")
+    t.update(np.ones((10, 3)))
+    assert _true(data == 1), "Update should be written into the array"
+    assert _true(o.output() == 10), "Output should see the update"
+
+    LOGGER.info("Testing arrays that can not be wrapped.")
+    for v, dtype in [([1, 2], None), (np.ones(3), np.float32),
+                     (np.ones(3, dtype=int), None),
+                     (np.array([1, np.nan]), None)]:
+        try:
+            tj.tensor(v, dtype=dtype, copy=False)
+            assert False, "%s should not be wrapped" % v
+        except ValueError:
+            pass
+
+    read_only = tj.tensor(np.memmap(path, dtype=np.float32, mode="r",
+                                    shape=(10, 3)), copy=False)
+    try:
+        read_only.update(np.zeros((10, 3)))
+        assert False, "Read only tensor should not be updated"
+    except ValueError:
+        pass
+
+    LOGGER.info("Testing chunks are views.")
+    chunks = list(t.chunks(4))
+    assert [len(c) for c in chunks] == [4, 4, 2],\
+        "Chunks should have 4, 4, 2 entries is %s" % [len(c) for c in chunks]
+    assert all(np.shares_memory(c, data) for c in chunks),\
+        "Chunks should be views"
+
+    x = tj.placeholder((None, 3))
+    o = tj.reduce(x * a, (3, ))
+
+    total = 0
+    for c, in tj.stream.chunks([t], 3):
+        total = total + o.output(feed={x: c})
+
+    assert _true(total == 10), "Chunked sum should be 10 is %s" % total
+
+
+def test_validation():
+    """Check the validation policies of the graph and primitives."""
+    nan = np.array([1, np.nan], dtype=np.float32)
+
+    LOGGER.info("Testing first-use only checks new tensors.")
+    t = tj.var(np.ones(2))
+    try:
+        tj.tensor([1, np.nan])
+        assert False, "NaN tensor should be invalid"
+    except ValueError:
+        pass
+
+    t.update(nan)
+
+    LOGGER.info("Testing updates give the tensor a copy of the value.")
+    before = t.output()
+    v = np.zeros(2, dtype=np.float32)
+    assert not np.shares_memory(t.update(v).output(), v),\
+        "Value should be copied"
+    assert not np.shares_memory(t.output(), before),\
+        "Earlier outputs should not be changed"
+    assert t.update([1, 2]).output().dtype == np.float32,\
+        "List should be converted"
+
+    try:
+        tj.tjgraph.set_validation("strict")
+        LOGGER.info("Testing strict checks updates.")
+        try:
+            t.update(nan)
+            assert False, "Update with NaN should be invalid"
+        except ValueError:
+            pass
+
+        t.set_validation("off")
+        t.update(nan)
+
+        LOGGER.info("Testing off never checks.")
+        tj.tjgraph.set_validation("off")
+        tj.tensor([1, np.nan])
+
+        try:
+            tj.tensor([1, np.nan], validation="strict")
+            assert False, "NaN tensor should be invalid"
+        except ValueError:
+            pass
+
+        for policy in ["sometimes", None]:
+            try:
+                tj.tjgraph.set_validation(policy)
+                assert False, "%s should not be a policy" % policy
+            except ValueError:
+                pass
+    finally:
+        tj.tjgraph.set_validation("first-use")
+
+
 if __name__ == "__main__":
     test_tensor_initialization()